@@ -1,35 +1,65 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, END
+import os
 import sqlite3
+from contextlib import contextmanager
 import pandas as pd
+import columnar
+import workbooks
+from importer import ImportJob
+from roster import Roster
+from storage import EMPLOYEE_COLUMNS, DatabaseManager
+from validation import validate_frame
+
+IMPORT_CHUNK_ROWS = 20_000
+FILE_TYPES = [("Excel files", "*.xlsx"), ("CSV files", "*.csv")]
+if columnar.available():
+    FILE_TYPES += [("Parquet files", "*.parquet"), ("Arrow files", "*.arrow *.feather")]
+
+def iter_file_chunks(filename, chunksize):
+    # Yields (DataFrame chunk, fraction read) for CSV and columnar files
+    if filename.endswith(".csv"):
+        size = os.path.getsize(filename)
+        with open(filename, "rb") as f, pd.read_csv(f, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield chunk, min(f.tell() / size, 1.0) if size else 1.0
+    elif columnar.is_columnar(filename):
+        yield from columnar.read_batches(filename, filename, chunksize)
+
+def read_import_file(filename, chunksize=IMPORT_CHUNK_ROWS):
+    # Yields (valid rows as a DataFrame, errors, row count, fraction read) for the import job's reader thread
+    if filename.endswith(".xlsx"):
+        # Chunks of each sheet, parsed and validated in parallel across sheets; invalid rows come back as errors
+        for result, done in workbooks.iter_sheets(filename, chunksize=chunksize):
+            yield result.frame, result.errors, result.row_count, done
+        return
+    # Other files are checked a chunk at a time the same way, extra columns included
+    for chunk, done in iter_file_chunks(filename, chunksize):
+        valid, rows, errors = validate_frame(chunk)
+        yield valid, errors, len(chunk), done
+        if rows is False:
+            return
 
-class DatabaseManager:
-    def __init__(self, db_name='employee.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
-        self.create_table()
-
-    def create_table(self):
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS employees
-                              (id INTEGER PRIMARY KEY, name TEXT, age TEXT, role TEXT)''')
-        self.conn.commit()
-
-    def insert_employee(self, details):
-        try:
-            self.cursor.execute("INSERT INTO employees (id, name, age, role) VALUES (?, ?, ?, ?)", details)
-            self.conn.commit()
-            return True
-        except sqlite3.IntegrityError as e:
-            messagebox.showerror(title="Error", message="An error occurred while inserting data: " + str(e))
-            return False
-
-    def delete_employee(self, employee_id):
-        self.cursor.execute("DELETE FROM employees WHERE id=?", (employee_id,))
-        self.conn.commit()
-
-    def get_employees(self):
-        self.cursor.execute("SELECT * FROM employees")
-        return self.cursor.fetchall()
+@contextmanager
+def sync_writer(db_manager, summary):
+    # Runs on the import job's writer thread. The file replaces the table, but as a sync: rows
+    # that hash the same as the stored ones aren't written, and the whole import is one
+    # transaction, so a cancelled or failed import leaves the table as it was. summary is filled
+    # with the sync's report once it commits.
+    with db_manager.sync() as session:
+        def write(df, errors):
+            if errors:
+                session.keep_missing()
+            if df.empty:
+                return {}
+            columns = [column.lower() if column.lower() in EMPLOYEE_COLUMNS else column for column in df.columns]
+            # Sheets of one workbook may each bring their own extra columns
+            counts = session.apply(df.astype(object).itertuples(index=False, name=None), columns)
+            return {"imported": counts["inserted"] + counts["updated"] + counts["unchanged"],
+                    "skipped": counts["duplicates"]}
+
+        yield write
+    summary.update(session.report)
 
 class CustomTkinterApp(tk.Tk):
     def __init__(self):
@@ -74,23 +104,31 @@ class CustomTkinterApp(tk.Tk):
         # Buttons
         self.save_button = tk.Button(self.left_frame, text="Save", font=self.font1, fg="#fff", bg="#4CAF50", command=self.insert, width=10)
         self.save_button.grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.update_button = tk.Button(self.left_frame, text="Update", font=self.font1, fg="#fff", bg="#9C27B0", command=self.update_record, width=10)
+        self.update_button.grid(row=5, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
         self.clear_button = tk.Button(self.left_frame, text="Clear", font=self.font1, fg="#fff", bg="#f44336", command=self.clear, width=10)
-        self.clear_button.grid(row=5, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.clear_button.grid(row=6, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
         self.delete_button = tk.Button(self.left_frame, text="Delete", font=self.font1, fg="#fff", bg="#2196F3", command=self.delete, width=10)
-        self.delete_button.grid(row=6, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.delete_button.grid(row=7, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
 
         # Add Import and Export buttons
         self.import_button = tk.Button(self.left_frame, text="Import", font=self.font1, fg="#fff", bg="#FF9800", command=self.import_data, width=10)
-        self.import_button.grid(row=7, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.import_button.grid(row=8, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
         self.export_button = tk.Button(self.left_frame, text="Export", font=self.font1, fg="#fff", bg="#607D8B", command=self.export_data, width=10)
-        self.export_button.grid(row=8, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.export_button.grid(row=9, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+
+        # Import progress, only shown while an import job is running
+        self.import_job = None
+        self.import_summary = {}
+        self.import_progress = ttk.Progressbar(self.left_frame, orient="horizontal", mode="determinate", maximum=1.0)
+        self.import_status = tk.Label(self.left_frame, text="", font=self.font3, bg="#f0f0f0", fg="#333")
 
         # Create separator between left and right frames
         self.separator = ttk.Separator(self.frame1, orient="vertical")
         self.separator.place(relx=0.4, rely=0, relheight=1)
 
         # Treeview for displaying data
-        self.tree = ttk.Treeview(self.frame1, style="mystyle.Treeview", columns=("ID", "Name", "Age", "Role"), show="headings")
+        self.tree = ttk.Treeview(self.frame1, style="mystyle.Treeview", columns=("ID", "Name", "Age", "Role"), show="headings", selectmode="extended")
         self.tree.heading("ID", text="ID", anchor=tk.CENTER)
         self.tree.heading("Name", text="Name", anchor=tk.CENTER)
         self.tree.heading("Age", text="Age", anchor=tk.CENTER)
@@ -99,7 +137,22 @@ class CustomTkinterApp(tk.Tk):
         self.tree.column("Name", width=200, anchor=tk.CENTER)
         self.tree.column("Age", width=100, anchor=tk.CENTER)
         self.tree.column("Role", width=150, anchor=tk.CENTER)
-        self.tree.place(relx=0.5, rely=0, relwidth=0.5, relheight=1, anchor=tk.NW)
+        self.tree.place(relx=0.5, rely=0, relwidth=0.48, relheight=1, anchor=tk.NW)
+
+        # Rows are loaded a page at a time as the tree is scrolled towards the end
+        self.scrollbar = ttk.Scrollbar(self.frame1, orient="vertical", command=self.tree.yview)
+        self.scrollbar.place(relx=0.98, rely=0, relwidth=0.02, relheight=1, anchor=tk.NW)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
+        self.page_size = 200
+        self.next_cursor = None
+        self.has_more_rows = False
+
+        # Loaded rows, plus employee id -> Treeview item (and back), so single-row changes don't
+        # need a reload and selections are read from the roster rather than from Tk
+        self.roster = Roster(columns=self.db_manager.get_column_names())
+        self.tree_items = {}
+        self.item_ids = {}
+        self.reload_generation = 0
 
         # Configure tag for font color
         self.tree.tag_configure("colored", foreground="#000000")  # Change font color to black
@@ -123,11 +176,14 @@ class CustomTkinterApp(tk.Tk):
         self.create_menu()
 
     def export_data(self):
-        filename = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
-        if filename:
-            data = []
-            for item in self.tree.get_children():
-                data.append(self.tree.item(item)["values"][:4])  # Limit to the first 4 columns
+        filename = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FILE_TYPES)
+        if filename.endswith(".parquet"):
+            columnar.write_parquet_export(self.db_manager, filename)
+        elif filename.endswith((".arrow", ".feather")):
+            columnar.write_arrow_export(self.db_manager, filename)
+        elif filename:
+            # Read from the database, the tree only holds the pages scrolled so far
+            data = [row[:4] for row in self.db_manager.get_employees()]  # Limit to the first 4 columns
             df = pd.DataFrame(data, columns=["ID", "Name", "Age", "Role"])
             if filename.endswith(".xlsx"):
                 df.to_excel(filename, index=False)
@@ -135,34 +191,68 @@ class CustomTkinterApp(tk.Tk):
                 df.to_csv(filename, index=False)
 
     def import_data(self):
-        filename = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
-        if filename:
-            try:
-                if filename.endswith(".xlsx"):
-                    df = pd.read_excel(filename)
-                elif filename.endswith(".csv"):
-                    df = pd.read_csv(filename)
-
-                # Clear existing data
-                self.db_manager.cursor.execute("DELETE FROM employees")
-                self.db_manager.conn.commit()
+        if self.import_job is not None:
+            return
+        filename = filedialog.askopenfilename(filetypes=FILE_TYPES)
 
-                # Add new columns dynamically
-                for column in df.columns:
-                    if column.lower() not in ['id', 'name', 'age', 'role']:
-                        self.db_manager.cursor.execute(f"ALTER TABLE employees ADD COLUMN '{column}' TEXT")
-                self.db_manager.conn.commit()
+        if filename:
+            # Parse and write in the background; poll_import reports back from the Tk event loop
+            self.import_summary = {}
+            self.import_job = ImportJob(read_import_file(filename),
+                                        lambda: sync_writer(self.db_manager, self.import_summary)).start()
+            self.import_button.config(text="Cancel", command=self.cancel_import)
+            self.set_editing(False)
+            self.import_progress["value"] = 0
+            self.import_progress.grid(row=10, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+            self.import_status.config(text="Starting import...")
+            self.import_status.grid(row=11, column=0, columnspan=2, padx=10, sticky="ew")
+            self.after(100, self.poll_import)
+
+    def set_editing(self, enabled):
+        # An import holds the only write connection until it commits, so a save in the meantime
+        # would block the window until then
+        for button in (self.save_button, self.update_button, self.delete_button):
+            button.config(state=tk.NORMAL if enabled else tk.DISABLED)
+
+    def cancel_import(self):
+        self.import_job.cancel()
+        self.import_status.config(text="Cancelling...")
+
+    def poll_import(self):
+        job = self.import_job
+        job.poll()
+        self.import_progress["value"] = job.fraction
+        self.import_status.config(text=f"Imported {job.totals['imported']:,} of {job.totals['rows']:,} rows")
+        if not job.finished:
+            self.after(100, self.poll_import)
+            return
 
-                # Insert imported data into the database
-                for index, row in df.iterrows():
-                    details = tuple(row)
-                    self.db_manager.insert_employee(details)
+        self.import_job = None
+        self.import_button.config(text="Import", command=self.import_data)
+        self.set_editing(True)
+        self.import_progress.grid_remove()
+        self.import_status.grid_remove()
 
-                # Refresh displayed data
-                self.display_data()
+        # Refresh displayed data
+        self.display_data()
 
-            except Exception as e:
-                messagebox.showerror(title="Error", message=f"An error occurred: {str(e)}")
+        if job.outcome == "failed":
+            messagebox.showerror(title="Error", message=f"An error occurred: {job.message}")
+        elif job.outcome == "cancelled":
+            messagebox.showwarning(title="Import", message="Import cancelled; no changes were made.")
+        elif self.import_summary:
+            summary = self.import_summary
+            messagebox.showinfo(title="Import", message=f"Added {summary['inserted']:,}, changed {summary['updated']:,}, "
+                                                        f"removed {summary['removed']:,}; "
+                                                        f"{summary['unchanged']:,} rows were already up to date."
+                                                        + (f"\nKept {summary['kept']:,} employees without a valid row in the file, "
+                                                           "because some rows failed validation." if summary["kept"] else ""))
+
+        if job.totals["skipped"]:
+            messagebox.showwarning(title="Import", message=f"Skipped {job.totals['skipped']} rows with duplicate IDs.")
+        if job.errors:
+            messagebox.showwarning(title="Import", message=f"{job.totals['failed']:,} rows failed validation:\n"
+                                                           + "\n".join(job.errors[:10]))
 
     def create_menu(self):
         menubar = tk.Menu(self)
@@ -174,8 +264,9 @@ class CustomTkinterApp(tk.Tk):
 
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
-            self.db_manager.conn.commit()  # Commit any pending changes to the database
-            self.db_manager.conn.close()  # Close database connection
+            if self.import_job is not None:
+                self.import_job.cancel()
+            self.db_manager.close()  # Close database connections
             self.destroy()
 
     def resize_fonts(self, event):
@@ -206,25 +297,54 @@ class CustomTkinterApp(tk.Tk):
             messagebox.showerror(title="Error", message="Please Enter All The Data.")
         else:
             details = (self.id_entry.get(), self.name_entry.get(), self.age_entry.get(), self.role_entry.get())
-            self.db_manager.insert_employee(details)
-            self.display_data()
+            try:
+                inserted = self.db_manager.insert_employee(details)
+            except sqlite3.Error as e:
+                messagebox.showerror(title="Error", message=f"Could not save: {e}")
+                return
+            if inserted:
+                self.show_row(self.db_manager.get_employee(details[0]))
+            else:
+                messagebox.showerror(title="Error", message="An employee with this ID already exists.")
+
+    def update_record(self):
+        if self.id_entry.get() == "" or self.name_entry.get() == "" or self.age_entry.get() == "" or self.role_entry.get() == "":
+            messagebox.showerror(title="Error", message="Please Enter All The Data.")
+            return
+        details = (self.id_entry.get(), self.name_entry.get(), self.age_entry.get(), self.role_entry.get())
+        try:
+            updated = self.db_manager.update_employee(details[0], details)
+        except sqlite3.Error as e:
+            messagebox.showerror(title="Error", message=f"Could not update: {e}")
+            return
+        if updated:
+            self.show_row(self.db_manager.get_employee(details[0]))
+        else:
+            messagebox.showerror(title="Error", message="No employee found with this ID.")
 
     def delete(self):
-        selected_row = self.tree.focus()
-        if not selected_row:
+        # Every selected row (Ctrl/Shift-click to select several), in one transaction
+        employee_ids = [self.item_ids[item] for item in self.tree.selection()]
+        if not employee_ids:
             messagebox.showerror(title="Error", message="Please select a row to delete.")
             return
-        employee_id = self.tree.item(selected_row)["values"][0]
-        self.db_manager.delete_employee(employee_id)
-        self.display_data()
+        if len(employee_ids) > 1 and not messagebox.askyesno(
+                title="Delete", message=f"Delete the {len(employee_ids)} selected employees?"):
+            return
+        try:
+            self.db_manager.delete_many(employee_ids)
+        except sqlite3.Error as e:
+            messagebox.showerror(title="Error", message=f"Could not delete: {e}")
+            return
+        for employee_id in employee_ids:
+            self.remove_row(employee_id)
         self.clear()
 
     def get_data(self, event):
         selected_row = self.tree.focus()
         if not selected_row:
             return
-        data = self.tree.item(selected_row)
-        row = data["values"]
+        row = self.roster.tree_values(self.item_ids[selected_row])
         self.clear()
         self.id_entry.insert(0, row[0])
         self.name_entry.insert(0, row[1])
@@ -232,10 +352,63 @@ class CustomTkinterApp(tk.Tk):
         self.role_entry.insert(0, row[3])
 
     def display_data(self):
+        # Full reload, only needed after imports. Refills as many rows as were loaded before,
+        # one page per idle slice so the window keeps handling events in between.
+        target = max(len(self.tree_items), self.page_size)
         self.tree.delete(*self.tree.get_children())
-        for row in self.db_manager.get_employees():
-            # Apply "colored" tag to Role column
-            self.tree.insert("", tk.END, values=row, tags=("colored" if row[3] == "Manager" else ""))
+        self.roster = Roster(columns=self.db_manager.get_column_names())
+        self.tree_items.clear()
+        self.item_ids.clear()
+        self.next_cursor = None
+        self.has_more_rows = True
+        self.reload_generation += 1
+        self.reload_pages(self.reload_generation, target)
+
+    def reload_pages(self, generation, target):
+        if generation != self.reload_generation:
+            return  # A newer reload has started
+        self.load_next_page()
+        if self.has_more_rows and len(self.tree_items) < target:
+            self.after_idle(self.reload_pages, generation, target)
+
+    def load_next_page(self):
+        rows, self.next_cursor = self.db_manager.get_employees_page(self.page_size, after=self.next_cursor)
+        self.has_more_rows = self.next_cursor is not None
+        for row in rows:
+            self.add_tree_row(row, tk.END)
+
+    def add_tree_row(self, row, index):
+        # Apply "colored" tag to Role column
+        self.roster.add(row)
+        item = self.tree.insert("", index, values=self.roster.tree_values(row[0]),
+                                tags=("colored" if row[3] == "Manager" else ""))
+        self.tree_items[row[0]] = item
+        self.item_ids[item] = row[0]
+
+    def show_row(self, row):
+        # Apply one inserted or updated row in place
+        item = self.tree_items.get(row[0])
+        if item is not None:
+            self.roster.add(row)
+            self.tree.item(item, values=self.roster.tree_values(row[0]), tags=("colored" if row[3] == "Manager" else ""))
+            return
+        # Rows past the loaded window arrive with a later page
+        index = self.db_manager.count_before(row[0])
+        if not self.has_more_rows or index < len(self.tree_items):
+            self.add_tree_row(row, index)
+
+    def remove_row(self, employee_id):
+        item = self.tree_items.pop(employee_id, None)
+        if item is not None:
+            self.roster.remove(employee_id)
+            del self.item_ids[item]
+            self.tree.delete(item)
+
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Fetch the next page once the visible window gets close to the last loaded row
+        if self.has_more_rows and float(last) > 0.9:
+            self.load_next_page()
 
     def clear(self):
         self.id_entry.delete(0, END)
@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import functools
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+from instrumentation import get_recorder, timed
+from storage import CONFLICT_POLICIES, EMPLOYEE_COLUMNS, PAGE_SORT_KEYS, DatabaseManager, EmployeeFilter
+from validation import validate_inputs
+
+# JSON over HTTP/1.1 for other systems:
+#   GET    /employees?page_size=&after=&order_by=&descending=&role=&min_age=&max_age=&name_prefix=
+#   POST   /employees                 one employee: {"id", "name", "age", "role"}
+#   POST   /employees/bulk            {"employees": [...], "on_conflict": "skip"|"replace"|"fail"}
+#   GET    /employees/<id>, PUT /employees/<id> (name, age, role), DELETE /employees/<id>
+#   GET    /search?q=&limit=, /count?<filters>, /stats, /metrics, /health
+# Reads run in a bounded thread pool. Single-row writes go straight to the storage write queue
+# without holding a thread, so concurrent requests share group commits.
+
+DB_WORKERS = 8
+MAX_PAGE_SIZE = 1000
+MAX_BODY_BYTES = 32 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+KEEP_ALIVE_SECONDS = 15
+MAX_REPORTED_ERRORS = 100
+
+class HTTPError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.payload = {"error": message, **extra}
+
+def parse_employee(data, employee_id=None):
+    # -> (id, name, age, role) tuple, or the validation messages
+    if isinstance(data, (list, tuple)):
+        data = dict(zip(EMPLOYEE_COLUMNS, data))
+    if not isinstance(data, dict):
+        return None, ["Expected an object with id, name, age and role."]
+    if employee_id is not None:
+        data = {**data, "id": employee_id}
+    # Text is stripped before validating, as the import validator does, so a blank role is rejected
+    values = {column: data.get(column) for column in EMPLOYEE_COLUMNS}
+    for column in ("id", "name", "role"):
+        if isinstance(values[column], str):
+            values[column] = values[column].strip()
+    employee_id, name, age, role = (values[column] for column in EMPLOYEE_COLUMNS)
+    errors = validate_inputs(employee_id, name, age, role)
+    if errors:
+        return None, errors
+    return (employee_id, name, int(age), role), []
+
+def filters_of(query):
+    try:
+        min_age = int(query["min_age"]) if "min_age" in query else None
+        max_age = int(query["max_age"]) if "max_age" in query else None
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "min_age and max_age must be integers")
+    return EmployeeFilter(role=query.get("role"), min_age=min_age, max_age=max_age,
+                          name_prefix=query.get("name_prefix"))
+
+def int_param(query, name, default, low=None, high=None):
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer")
+    if low is not None and high is not None and not low <= value <= high:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be between {low} and {high}")
+    return value
+
+class EmployeeAPI:
+    def __init__(self, db_manager, workers=DB_WORKERS):
+        self.db = db_manager
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-db")
+        # (method, path pattern, handler); a path that matches with another method is a 405. The first
+        # pattern to match a path owns it, so literal paths go before the patterns they would also match
+        # (/employees/bulk is never an employee id).
+        self.routes = [
+            ("GET", r"/health", self.health),
+            ("GET", r"/metrics", self.metrics),
+            ("GET", r"/employees", self.list_employees),
+            ("POST", r"/employees", self.create_employee),
+            ("POST", r"/employees/bulk", self.bulk_upsert),
+            ("GET", r"/employees/(?P<employee_id>[^/]+)", self.get_employee),
+            ("PUT", r"/employees/(?P<employee_id>[^/]+)", self.update_employee),
+            ("DELETE", r"/employees/(?P<employee_id>[^/]+)", self.delete_employee),
+            ("GET", r"/search", self.search),
+            ("GET", r"/count", self.count),
+            ("GET", r"/stats", self.stats),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in self.routes]
+
+    async def call(self, function, *args):
+        # Blocking storage calls, on the bounded pool
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(function, *args))
+
+    async def write(self, operation, *args):
+        return await asyncio.wrap_future(self.db.submit(operation, *args))
+
+    def records(self, rows):
+        columns = self.db.get_column_names()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    # Handlers take (path parameters, query, body) and return (status, payload)
+
+    async def health(self, params, query, body):
+        return HTTPStatus.OK, {"status": "ok", "write_queue_depth": self.db.writes.depth()}
+
+    async def metrics(self, params, query, body):
+        recorder = get_recorder()
+        if not hasattr(recorder, "to_prometheus"):
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Metrics are not being recorded")
+        return HTTPStatus.OK, recorder.to_prometheus(gauges=self.db.diagnostics_gauges())
+
+    async def list_employees(self, params, query, body):
+        page_size = int_param(query, "page_size", 50, 1, MAX_PAGE_SIZE)
+        order_by = query.get("order_by", "id")
+        if order_by not in PAGE_SORT_KEYS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"order_by must be one of: {', '.join(PAGE_SORT_KEYS)}")
+        descending = query.get("descending", "false").lower() in ("1", "true", "yes")
+        after = None
+        if "after" in query:
+            # The "next" cursor of the previous page, passed back as JSON
+            try:
+                after = json.loads(query["after"])
+            except ValueError:
+                after = None
+            # [sort value, id] with plain values only; anything else can't be a cursor we handed out
+            if (not isinstance(after, list) or len(after) != 2
+                    or not all(value is None or type(value) in (str, int, float) for value in after)):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "after must be the JSON cursor from the previous page")
+            after = tuple(after)
+        filters = filters_of(query)
+
+        def page():
+            rows, next_after = self.db.get_employees_page(page_size, after, order_by, descending, filters)
+            return {"employees": self.records(rows), "next": None if next_after is None else list(next_after)}
+        return HTTPStatus.OK, await self.call(page)
+
+    async def get_employee(self, params, query, body):
+        row = await self.call(self.db.get_employee, params["employee_id"])
+        if row is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Employee not found")
+        return HTTPStatus.OK, (await self.call(self.records, [row]))[0]
+
+    async def create_employee(self, params, query, body):
+        details, errors = parse_employee(body)
+        if errors:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, "Invalid employee", errors=errors)
+        if not await self.write("insert", details):
+            raise HTTPError(HTTPStatus.CONFLICT, "Employee ID already exists")
+        return HTTPStatus.CREATED, dict(zip(EMPLOYEE_COLUMNS, details))
+
+    async def update_employee(self, params, query, body):
+        details, errors = parse_employee(body, params["employee_id"])
+        if errors:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, "Invalid employee", errors=errors)
+        if not await self.write("update", details[0], details):
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Employee not found")
+        return HTTPStatus.OK, dict(zip(EMPLOYEE_COLUMNS, details))
+
+    async def delete_employee(self, params, query, body):
+        if not await self.write("delete", params["employee_id"]):
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Employee not found")
+        return HTTPStatus.NO_CONTENT, None
+
+    async def bulk_upsert(self, params, query, body):
+        if not isinstance(body, dict) or not isinstance(body.get("employees"), list):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected {"employees": [...]}')
+        on_conflict = body.get("on_conflict", "replace")
+        if on_conflict not in CONFLICT_POLICIES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"on_conflict must be one of: {', '.join(CONFLICT_POLICIES)}")
+        rows, errors = [], []
+        for number, data in enumerate(body["employees"], start=1):
+            details, row_errors = parse_employee(data)
+            if row_errors:
+                errors.append(f"Row {number}: {', '.join(row_errors)}")
+            else:
+                rows.append(details)
+        if errors:
+            # All or nothing, so a client can fix the batch and resend it as is
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, f"{len(errors)} of {len(body['employees'])} rows are invalid; nothing was written",
+                            errors=errors[:MAX_REPORTED_ERRORS])
+        report = await self.call(self.db.insert_many, rows, on_conflict)
+        counts = {outcome: len(ids) for outcome, ids in report.items()}
+        if report["conflicted"]:
+            raise HTTPError(HTTPStatus.CONFLICT, "Some employee IDs already exist; nothing was written",
+                            conflicted=report["conflicted"][:MAX_REPORTED_ERRORS])
+        return HTTPStatus.OK, counts
+
+    async def search(self, params, query, body):
+        text = query.get("q", "")
+        limit = int_param(query, "limit", 50, 1, MAX_PAGE_SIZE)
+        return HTTPStatus.OK, {"employees": await self.call(lambda: self.records(self.db.search_employees(text, limit)))}
+
+    async def count(self, params, query, body):
+        return HTTPStatus.OK, {"count": await self.call(self.db.count_employees, filters_of(query))}
+
+    async def stats(self, params, query, body):
+        rows = await self.call(self.db.get_workforce_stats)
+        return HTTPStatus.OK, [{"role": role, "age_band": band, "headcount": headcount} for role, band, headcount in rows]
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        allowed = []
+        owner = None
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if not match or owner not in (None, pattern.pattern):
+                continue
+            owner = pattern.pattern
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            params = {key: unquote(value) for key, value in match.groupdict().items()}
+            if body:
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+            with timed(f"api_{handler.__name__}"):
+                return await handler(params, query, body)
+        if allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use {', '.join(allowed)}")
+        raise HTTPError(HTTPStatus.NOT_FOUND, "No such endpoint")
+
+    async def handle_connection(self, reader, writer):
+        # One request at a time per connection, kept open between requests (HTTP/1.1 keep-alive)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_SECONDS)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                       {"error": "Request headers too large"}, keep_alive=False)
+                    return
+                request_line, *header_lines = head.decode("latin1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ")
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line"}, keep_alive=False)
+                    return
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self.respond(writer, HTTPStatus.LENGTH_REQUIRED,
+                                       {"error": "Send a Content-Length instead of chunked encoding"}, keep_alive=False)
+                    return
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_BYTES:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length > 0 else HTTPStatus.BAD_REQUEST,
+                                       {"error": f"Content-Length must be between 0 and {MAX_BODY_BYTES}"}, keep_alive=False)
+                    return
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, e.payload
+                except Exception as e:
+                    print(f"{method} {target} failed: {e!r}", file=sys.stderr)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal error"}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        if payload is None:
+            body, content_type = b"", "application/json"
+        elif isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode("utf-8"), "application/json"
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+async def serve(db_manager, host="127.0.0.1", port=8080, workers=DB_WORKERS):
+    # Returns (server, api); close both when done. port=0 picks a free port.
+    api = EmployeeAPI(db_manager, workers)
+    server = await asyncio.start_server(api.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    return server, api
+
+async def run(args):
+    db_manager = DatabaseManager(args.db, pool_size=args.workers)
+    server, api = await serve(db_manager, args.host, args.port, args.workers)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"Serving {args.db} on http://{host}:{port}", file=sys.stderr, flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        api.close()
+        db_manager.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON API over the employee database.")
+    parser.add_argument("--db", default="employee.db", help="SQLite database file (default: employee.db)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=DB_WORKERS, help="threads for blocking database calls")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
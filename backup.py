@@ -0,0 +1,197 @@
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from instrumentation import timed
+
+# Pages copied per backup step, and the pause between steps that lets other work run
+BACKUP_STEP_PAGES = 1024
+BACKUP_STEP_SLEEP = 0.002
+DEFAULT_KEEP = 7
+# Roster pages compress well even at low levels; 3 is about twice as fast as gzip's default of 6
+COMPRESS_LEVEL = 3
+GZIP_MAGIC = b"\x1f\x8b"
+COPY_BUFFER_BYTES = 1024 * 1024
+
+# seconds is the whole backup; longest_step is the longest a single step held the source's read
+# lock. Under WAL, which the storage layer always uses, writers never wait on it; under a rollback
+# journal, a commit waits at most one step.
+BackupResult = namedtuple("BackupResult", ["path", "pages", "steps", "seconds", "longest_step", "bytes"])
+
+def _connect_readonly(db_name):
+    return sqlite3.connect(f"file:{os.path.abspath(db_name)}?mode=ro", uri=True, check_same_thread=False)
+
+def _quick_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise sqlite3.DatabaseError(f"Backup {path} failed its integrity check: {result}")
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _copy_pages(source, dest_path, pages, sleep, progress):
+    # Online backup API, a step at a time. Under WAL the source keeps one read transaction open
+    # across the steps, so every step copies the same snapshot and concurrent commits can't make
+    # the backup start over.
+    steps, longest, copied = 0, 0.0, 0
+    wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    if wal:
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+    dest = sqlite3.connect(dest_path)
+    last = time.perf_counter()
+
+    def step(status, remaining, total):
+        nonlocal steps, longest, copied, last
+        now = time.perf_counter()
+        steps += 1
+        longest = max(longest, now - last)
+        copied = total
+        if progress:
+            progress(total - remaining, total)
+        # The pause between steps isn't lock time
+        last = time.perf_counter() + sleep
+
+    try:
+        source.backup(dest, pages=pages, progress=step, sleep=sleep)
+    finally:
+        dest.close()
+        if wal:
+            source.execute("COMMIT")
+    return copied, steps, longest
+
+def backup(db_name, dest, compress=False, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP, verify=True, progress=None):
+    # Copy a live database to dest without blocking its readers or writers; with compress, dest
+    # is a gzip archive of the copy. progress(pages_done, pages_total) is called after each step.
+    start = time.perf_counter()
+    copy_path = f"{dest}.partial"
+    _remove(copy_path)
+    with timed("backup") as call:
+        source = _connect_readonly(db_name)
+        try:
+            copied, steps, longest = _copy_pages(source, copy_path, pages, sleep, progress)
+        finally:
+            source.close()
+        try:
+            if verify:
+                _quick_check(copy_path)
+            if compress:
+                archive_path = f"{dest}.partial.gz"
+                with open(copy_path, "rb") as raw, gzip.open(archive_path, "wb", compresslevel=COMPRESS_LEVEL) as archive:
+                    shutil.copyfileobj(raw, archive, COPY_BUFFER_BYTES)
+                _remove(copy_path)
+                copy_path = archive_path
+            os.replace(copy_path, dest)
+        finally:
+            _remove(copy_path)
+        call.rows = copied
+    return BackupResult(dest, copied, steps, time.perf_counter() - start, longest, os.path.getsize(dest))
+
+def restore(archive, db_name, overwrite=False):
+    # Rebuild db_name from a backup or snapshot (plain or gzip). The copy is checked before it
+    # replaces anything. Stop every process using db_name before overwriting it.
+    if os.path.exists(db_name) and not overwrite:
+        raise FileExistsError(f"{db_name} already exists")
+    partial = f"{db_name}.restoring"
+    _remove(partial)
+    start = time.perf_counter()
+    with timed("restore"):
+        try:
+            with open(archive, "rb") as f:
+                compressed = f.read(2) == GZIP_MAGIC
+            if compressed:
+                with gzip.open(archive, "rb") as source, open(partial, "wb") as out:
+                    shutil.copyfileobj(source, out, COPY_BUFFER_BYTES)
+            else:
+                # One step: nothing else is using the backup file
+                source = _connect_readonly(archive)
+                dest = sqlite3.connect(partial)
+                try:
+                    source.backup(dest)
+                finally:
+                    dest.close()
+                    source.close()
+            _quick_check(partial)
+            # A stale WAL would be replayed over the restored pages
+            for suffix in ("-wal", "-shm"):
+                _remove(db_name + suffix)
+            os.replace(partial, db_name)
+        finally:
+            _remove(partial)
+    return time.perf_counter() - start
+
+def _snapshot_prefix(db_name):
+    return os.path.splitext(os.path.basename(db_name))[0] + "-"
+
+def list_snapshots(directory, db_name):
+    # Oldest first; names sort by the UTC time they were taken
+    pattern = re.compile(re.escape(_snapshot_prefix(db_name)) + r"\d{8}T\d{6}\.\d{6}Z\.db(\.gz)?$")
+    try:
+        names = sorted(name for name in os.listdir(directory) if pattern.match(name))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+def snapshot(db_name, directory, keep=DEFAULT_KEEP, compress=False, **options):
+    # A timestamped backup in directory; only the newest keep snapshots are kept
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+    path = os.path.join(directory, f"{_snapshot_prefix(db_name)}{stamp}.db" + (".gz" if compress else ""))
+    result = backup(db_name, path, compress=compress, **options)
+    for old in list_snapshots(directory, db_name)[:-keep] if keep > 0 else []:
+        _remove(old)
+    return result
+
+class SnapshotScheduler:
+    # Takes a snapshot every interval seconds on a daemon thread until stopped. on_result gets each
+    # BackupResult, or the exception when a snapshot fails; the schedule carries on either way.
+    def __init__(self, db_name, directory, interval, keep=DEFAULT_KEEP, compress=False, on_result=None):
+        self.db_name = db_name
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.compress = compress
+        self.on_result = on_result
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def wait(self, timeout=None):
+        # True once stopped
+        return self._stop.wait(timeout)
+
+    def _run(self):
+        due = time.monotonic()
+        while True:
+            due += self.interval
+            try:
+                self.last_result = snapshot(self.db_name, self.directory, self.keep, self.compress)
+            except (OSError, sqlite3.Error) as e:
+                self.last_result = e
+            if self.on_result:
+                self.on_result(self.last_result)
+            # Runs that overrun the interval are skipped rather than queued
+            while due <= time.monotonic():
+                due += self.interval
+            if self._stop.wait(due - time.monotonic()):
+                return
@@ -0,0 +1,357 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import exports
+import importer
+from storage import DatabaseManager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIRST_NAMES = ["James", "Mary", "Ravi", "Priya", "Chen", "Ana", "Omar", "Fatima", "Lukas", "Sofia",
+               "Kenji", "Aisha", "Mateo", "Olga", "Kwame", "Elena", "Noah", "Zara", "Ivan", "Mei"]
+LAST_NAMES = ["Smith", "Patel", "Garcia", "Nguyen", "Kim", "Okafor", "Müller", "Rossi", "Silva", "Khan",
+              "Cohen", "Ivanova", "Sato", "Dubois", "Novak", "Haddad", "Larsen", "Moreau", "Reyes", "Koli"]
+ROLES = ["Manager", "Developer", "Designer", "Analyst", "Tester", "HR Specialist", "Accountant",
+         "Product Owner", "Data Scientist", "Support Engineer"]
+
+# Header spellings normalize_column_name has to map back to id, name, age and role
+MESSY_HEADERS = [
+    ["ID", "Name", "Age", "Role"],
+    ["Employee ID", "Full Name", "Years", "Job Title"],
+    [" emp id ", "EMPLOYEE NAME", "Employee Age", "Position"],
+    ["EmpID", "FullName", "employee age", "Occupation"],
+    ["Identifier", "Person", "AGE", "Title"],
+]
+BAD_ROW_RATE = 0.01
+XLSX_MAX_ROWS = 1_048_575  # Excel's sheet limit, minus the header
+SITE_SHEETS = 4  # messy_sheets.xlsx splits the roster into one sheet per site
+DEFAULT_TOLERANCE = 0.25
+
+def parse_count(text):
+    # "10k" -> 10000, "1.5M" -> 1500000
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+def generate_roster(rows, seed=42):
+    # Deterministic synthetic roster with unique, sortable IDs
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=rows)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(len(LAST_NAMES), size=rows)]
+    return pd.DataFrame({
+        "id": pd.Series(np.arange(rows)).astype(str).str.zfill(8).radd("EMP-"),
+        "name": first + " " + last,
+        "age": rng.integers(18, 66, size=rows),
+        "role": np.array(ROLES, dtype=object)[rng.integers(len(ROLES), size=rows)],
+    })
+
+def make_messy(df, seed=42):
+    # The same roster as an HR export would send it: odd headers, padding, an extra column
+    # and a small share of rows that fail validation
+    import numpy as np
+    rng = np.random.default_rng(seed + 1)
+    messy = df.astype({"age": object}).copy()
+    messy["name"] = np.where(rng.random(len(df)) < 0.2, "  " + messy["name"] + " ", messy["name"])
+    bad = rng.random(len(df)) < BAD_ROW_RATE
+    messy.loc[bad, "age"] = rng.choice(["", "abc", "17", "120"], size=int(bad.sum()))
+    messy.columns = MESSY_HEADERS[int(rng.integers(len(MESSY_HEADERS)))]
+    messy.insert(2, "Department", np.array(["Sales", "R&D", "Ops"], dtype=object)[rng.integers(3, size=len(df))])
+    return messy
+
+def write_files(workdir, rows, seed):
+    import pandas as pd
+    df = generate_roster(rows, seed)
+    df.to_csv(os.path.join(workdir, "roster.csv"), index=False)
+    messy = make_messy(df, seed)
+    messy.to_csv(os.path.join(workdir, "messy.csv"), index=False)
+    messy.to_csv(os.path.join(workdir, "messy.txt"), sep="\t", index=False)
+    messy.head(XLSX_MAX_ROWS).to_excel(os.path.join(workdir, "messy.xlsx"), index=False)
+    # Each site's sheet spells the headers its own way
+    columns = [column for column in messy.columns if column != "Department"]
+    per_sheet = min(-(-len(messy) // SITE_SHEETS), XLSX_MAX_ROWS)
+    with pd.ExcelWriter(os.path.join(workdir, "messy_sheets.xlsx")) as writer:
+        for site in range(SITE_SHEETS):
+            part = messy.iloc[site * per_sheet:(site + 1) * per_sheet]
+            part.rename(columns=dict(zip(columns, MESSY_HEADERS[site % len(MESSY_HEADERS)]))) \
+                .to_excel(writer, sheet_name=f"Site {site + 1}", index=False)
+
+def peak_rss_mb():
+    # VmHWM starts fresh in a new process image; ru_maxrss can carry the parent's peak over exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def open_seeded(workdir, name):
+    path = os.path.join(workdir, name)
+    shutil.copy(os.path.join(workdir, "seed.db"), path)
+    return DatabaseManager(path)
+
+EXPORT_WRITERS = {"csv": exports.write_csv_export, "xlsx": exports.write_excel_export, "txt": exports.write_text_export}
+
+def sample_ids(rows, count, seed):
+    return [f"EMP-{i:08d}" for i in random.Random(seed).sample(range(rows), min(count, rows))]
+
+# Each case prepares its inputs, then returns (seconds, items processed) for the timed part only
+
+def bench_insert_many(workdir, rows, seed):
+    with open(os.path.join(workdir, "roster.csv"), newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        data = [(employee_id, name, int(age), role) for employee_id, name, age, role in reader]
+    db = DatabaseManager(os.path.join(workdir, "seed.db"))
+    start = time.perf_counter()
+    db.insert_many(data)
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed, rows
+
+def bench_insert_employee(workdir, rows, seed):
+    db = open_seeded(workdir, "insert.db")
+    start = time.perf_counter()
+    for i in range(1000):
+        db.insert_employee((f"NEW-{i:06d}", "New Hire", 30, "Developer"))
+    return time.perf_counter() - start, 1000
+
+def bench_update_employee(workdir, rows, seed):
+    db = open_seeded(workdir, "update.db")
+    ids = sample_ids(rows, 1000, seed)
+    start = time.perf_counter()
+    for employee_id in ids:
+        db.update_employee(employee_id, (employee_id, "Renamed Person", 40, "Manager"))
+    return time.perf_counter() - start, len(ids)
+
+def bench_delete_employee(workdir, rows, seed):
+    db = open_seeded(workdir, "delete.db")
+    ids = sample_ids(rows, 1000, seed)
+    start = time.perf_counter()
+    for employee_id in ids:
+        db.delete_employee(employee_id)
+    return time.perf_counter() - start, len(ids)
+
+def bench_get_employees(workdir, rows, seed):
+    db = open_seeded(workdir, "read.db")
+    start = time.perf_counter()
+    count = len(db.get_employees())
+    return time.perf_counter() - start, count
+
+def bench_get_employee(workdir, rows, seed):
+    db = open_seeded(workdir, "read.db")
+    ids = sample_ids(rows, 1000, seed)
+    start = time.perf_counter()
+    for employee_id in ids:
+        db.get_employee(employee_id)
+    return time.perf_counter() - start, len(ids)
+
+def bench_get_employees_page(workdir, rows, seed):
+    db = open_seeded(workdir, "read.db")
+    start = time.perf_counter()
+    cursor, pages = None, 0
+    while pages < 100:
+        _, cursor = db.get_employees_page(50, after=cursor, order_by="name")
+        pages += 1
+        if cursor is None:
+            break
+    return time.perf_counter() - start, pages
+
+def bench_search_employees(workdir, rows, seed):
+    db = open_seeded(workdir, "read.db")
+    queries = [name[:length] for name in FIRST_NAMES + LAST_NAMES for length in (2, 4)]
+    queries += [role.split()[0] for role in ROLES] + sample_ids(rows, 50, seed)
+    start = time.perf_counter()
+    for query in queries:
+        db.search_employees(query, limit=50)
+    return time.perf_counter() - start, len(queries)
+
+def bench_validate_imported_data(workdir, rows, seed):
+    import pandas as pd
+    from validation import validate_imported_data
+    df = pd.read_csv(os.path.join(workdir, "messy.csv"))
+    start = time.perf_counter()
+    validate_imported_data(df)
+    return time.perf_counter() - start, len(df)
+
+def bench_parse(extension):
+    def bench(workdir, rows, seed):
+        # The readers import pandas and openpyxl on first use; load them before the timer starts
+        import workbooks
+        with open(os.path.join(workdir, f"messy.{extension}"), "rb") as f:
+            start = time.perf_counter()
+            count = len(importer.read_upload(f))
+        return time.perf_counter() - start, count
+    return bench
+
+def bench_stream(extension):
+    def bench(workdir, rows, seed):
+        import workbooks
+        with open(os.path.join(workdir, f"messy.{extension}"), "rb") as f:
+            start = time.perf_counter()
+            count = sum(len(chunk) for chunk, _ in importer.iter_upload_chunks(f))
+        return time.perf_counter() - start, count
+    return bench
+
+def bench_import_sheets(workdir, rows, seed):
+    # Parse and validate every sheet, in parallel, as the import paths do
+    import workbooks
+    start = time.perf_counter()
+    count = sum(result.row_count for result, _ in workbooks.iter_sheets(os.path.join(workdir, "messy_sheets.xlsx")))
+    return time.perf_counter() - start, count
+
+def bench_export(fmt):
+    def bench(workdir, rows, seed):
+        if fmt == "xlsx":
+            import openpyxl  # Imported by the Excel writer on first use, outside the timed part
+        db = open_seeded(workdir, "read.db")
+        with open(os.path.join(workdir, f"export.{fmt}"), "wb") as out:
+            start = time.perf_counter()
+            EXPORT_WRITERS[fmt](db, out)
+        return time.perf_counter() - start, rows
+    return bench
+
+def bench_export_delta(workdir, rows, seed):
+    # A night's churn: a thousand updates and a hundred deletes on top of the seeded roster
+    db = open_seeded(workdir, "delta.db")
+    watermark = db.change_watermark()
+    ids = sample_ids(rows, 1100, seed)
+    for employee_id in ids[:1000]:
+        db.update_employee(employee_id, (employee_id, "Renamed Person", 40, "Manager"))
+    for employee_id in ids[1000:]:
+        db.delete_employee(employee_id)
+    with open(os.path.join(workdir, "export_delta.csv"), "wb") as out:
+        start = time.perf_counter()
+        exports.write_delta_export(db, out, watermark, db.change_watermark())
+    return time.perf_counter() - start, len(ids)
+
+def bench_find_duplicates(workdir, rows, seed):
+    # Full-roster duplicate scan: blocking, candidate pairs and scoring
+    import duplicates
+    db = open_seeded(workdir, "duplicates.db")
+    frame = duplicates.roster_frame(db)
+    start = time.perf_counter()
+    duplicates.find_duplicates(frame)
+    return time.perf_counter() - start, rows
+
+# insert_many runs first and leaves seed.db behind for the cases after it
+CASES = {
+    "insert_many": bench_insert_many,
+    "insert_employee": bench_insert_employee,
+    "update_employee": bench_update_employee,
+    "delete_employee": bench_delete_employee,
+    "get_employees": bench_get_employees,
+    "get_employee": bench_get_employee,
+    "get_employees_page": bench_get_employees_page,
+    "search_employees": bench_search_employees,
+    "validate_imported_data": bench_validate_imported_data,
+    "parse_csv": bench_parse("csv"),
+    "parse_txt": bench_parse("txt"),
+    "parse_xlsx": bench_parse("xlsx"),
+    "stream_csv": bench_stream("csv"),
+    "stream_xlsx": bench_stream("xlsx"),
+    "import_xlsx_sheets": bench_import_sheets,
+    "export_csv": bench_export("csv"),
+    "export_xlsx": bench_export("xlsx"),
+    "export_txt": bench_export("txt"),
+    "export_delta": bench_export_delta,
+    "find_duplicates": bench_find_duplicates,
+}
+
+def run_case(name, workdir, rows, seed):
+    # Runs in a fresh process so the peak RSS belongs to this case alone
+    seconds, items = CASES[name](workdir, rows, seed)
+    return {"case": name, "rows": rows, "seconds": round(seconds, 4), "items": items,
+            "per_second": round(items / seconds, 1) if seconds else None, "peak_rss_mb": peak_rss_mb()}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for result in results:
+        previous = baseline.get(f"{result['case']}@{result['rows']}")
+        if previous and result["seconds"] > previous["seconds"] * (1 + tolerance):
+            regressions.append((result, previous))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Employee Management System back end.")
+    parser.add_argument("--rows", default="10k", help="comma-separated roster sizes, e.g. 10k,100k,1M")
+    parser.add_argument("--cases", help="comma-separated subset of: " + ", ".join(CASES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="keep generated files here instead of a temporary directory")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a stored baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown against the baseline (default 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_count(size) for size in args.rows.split(",")]
+    names = args.cases.split(",") if args.cases else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    if "insert_many" not in names:
+        names.insert(0, "insert_many")  # Builds the database every other case reads
+
+    workroot = args.workdir or tempfile.mkdtemp(prefix="ems-bench-")
+    results = []
+    # Spawned children start clean, so one case's memory doesn't show up in the next one's peak
+    context = multiprocessing.get_context("spawn")
+    try:
+        for rows in sizes:
+            workdir = os.path.join(workroot, str(rows))
+            shutil.rmtree(workdir, ignore_errors=True)
+            os.makedirs(workdir)
+            print(f"Generating {rows:,} rows in {workdir}...", flush=True)
+            write_files(workdir, rows, args.seed)
+            for name in names:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_case, name, workdir, rows, args.seed).result()
+                results.append(result)
+                print(f"  {name:<24} {result['seconds']:>9.3f}s {result['per_second'] or 0:>14,.0f}/s "
+                      f"{result['peak_rss_mb'] or 0:>9.1f} MB", flush=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workroot, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    exit_code = 0
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for result, previous in regressions:
+            print(f"REGRESSION {result['case']} @ {result['rows']:,} rows: "
+                  f"{result['seconds']:.3f}s vs {previous['seconds']:.3f}s baseline")
+        exit_code = 1 if regressions else 0
+        if not regressions:
+            print(f"No regressions against {args.baseline}.")
+    if args.save_baseline:
+        baseline_path = args.baseline or "benchmark_baseline.json"
+        with open(baseline_path, "w") as f:
+            json.dump({f"{result['case']}@{result['rows']}": result for result in results}, f, indent=2)
+        print(f"Saved baseline to {baseline_path}.")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
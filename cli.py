@@ -0,0 +1,278 @@
+import argparse
+import csv
+import io
+import os
+import sys
+from contextlib import contextmanager
+import backup
+from importer import ImportJob, import_writer, read_import_batches
+from storage import CONFLICT_POLICIES, EMPLOYEE_COLUMNS, DatabaseManager, EmployeeFilter
+
+# Headless entry point for scheduled jobs:
+#   python cli.py [--db employee.db] import|export|changes|trim|search|count|stats|duplicates|backup|snapshot|restore ...
+# Results go to stdout as CSV (or the export format), messages to stderr, and the exit code is
+# non-zero when anything failed. Only the storage layer is loaded up front; pandas, openpyxl and
+# pyarrow are imported by the commands and formats that need them, so lookups start quickly.
+
+IMPORT_FORMATS = ["csv", "txt", "xlsx", "parquet", "arrow", "feather"]
+EXPORT_FORMATS = ["csv", "txt", "xlsx", "parquet", "arrow"]
+
+def export_writer(fmt):
+    if fmt in ("parquet", "arrow"):
+        import columnar
+        if not columnar.available():
+            raise SystemExit(f"{fmt} export needs pyarrow")
+        return columnar.write_parquet_export if fmt == "parquet" else columnar.write_arrow_export
+    import exports
+    return {"csv": exports.write_csv_export, "txt": exports.write_text_export,
+            "xlsx": exports.write_excel_export}[fmt]
+
+def format_of(path, default):
+    extension = os.path.splitext(path or "")[1].lstrip(".").lower()
+    return extension or default
+
+@contextmanager
+def open_output(path):
+    # Files are written under a temporary name and only replace path once the command succeeds,
+    # so a failed export leaves no partial file behind
+    if path and path != "-":
+        partial = f"{path}.partial"
+        try:
+            with open(partial, "wb") as out:
+                yield out
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+    else:
+        yield sys.stdout.buffer
+
+def write_rows(db_manager, rows):
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    writer.writerow(db_manager.get_column_names())
+    writer.writerows(rows)
+
+@contextmanager
+def sync_writer(db_manager, summary):
+    # Validated rows replace the table, writing only what changed (see DatabaseManager.sync)
+    with db_manager.sync() as session:
+        def write(rows, errors):
+            if errors:
+                session.keep_missing()
+            if not rows:
+                return {}
+            counts = session.apply(rows)
+            return {"imported": counts["inserted"] + counts["updated"] + counts["unchanged"],
+                    "skipped": counts["duplicates"]}
+        yield write
+    summary.update(session.report)
+
+def run_import(db_manager, args):
+    if args.file == "-":
+        # Readers seek to sniff the encoding, so standard input is read up front
+        upload = io.BytesIO(sys.stdin.buffer.read())
+        upload.name = f"stdin.{args.format or 'csv'}"
+    else:
+        upload = open(args.file, "rb")
+        if args.format:
+            upload = io.BytesIO(upload.read())
+            upload.name = f"{os.path.basename(args.file)}.{args.format}"
+    summary = {}
+    writer = (lambda: sync_writer(db_manager, summary)) if args.sync else (lambda: import_writer(db_manager, args.on_conflict))
+    with upload:
+        job = ImportJob(read_import_batches(upload), writer).start()
+        try:
+            job.wait()
+        except KeyboardInterrupt:
+            job.cancel()
+            job.wait()
+    totals = job.totals
+    print(f"Imported {totals['imported']:,} of {totals['rows']:,} rows; "
+          f"{totals['skipped']:,} skipped, {totals['failed']:,} failed", file=sys.stderr)
+    if summary:
+        print(f"Added {summary['inserted']:,}, changed {summary['updated']:,}, removed {summary['removed']:,}, "
+              f"unchanged {summary['unchanged']:,}", file=sys.stderr)
+        if summary["kept"]:
+            print(f"Kept {summary['kept']:,} employees without a valid row in the file, because some rows failed validation",
+                  file=sys.stderr)
+    for error in job.errors:
+        print(error, file=sys.stderr)
+    if job.outcome != "completed":
+        print(f"Import {job.outcome}: {job.message}", file=sys.stderr)
+        return 1
+    return 1 if totals["failed"] else 0
+
+def run_export(db_manager, args):
+    fmt = args.format or format_of(args.output, "csv")
+    if fmt not in EXPORT_FORMATS:
+        raise SystemExit(f"Unknown export format '{fmt}'. Expected one of: {', '.join(EXPORT_FORMATS)}")
+    with open_output(args.output) as out:
+        export_writer(fmt)(db_manager, out)
+    return 0
+
+def run_changes(db_manager, args):
+    # The watermark the delta ends at goes to stderr, ready to pass as --since next time
+    import exports
+    upto = db_manager.change_watermark() if args.upto is None else args.upto
+    try:
+        with open_output(args.output) as out:
+            exports.write_delta_export(db_manager, out, args.since, upto)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(upto, file=sys.stderr)
+    return 0
+
+def run_trim(db_manager, args):
+    upto = min(args.upto, db_manager.change_watermark())
+    removed = db_manager.trim_changes(upto)
+    print(f"Removed {removed:,} change log entries; deltas now start from watermark {upto} or later", file=sys.stderr)
+    return 0
+
+def run_search(db_manager, args):
+    write_rows(db_manager, db_manager.search_employees(args.query, args.limit))
+    return 0
+
+def filters_of(args):
+    return EmployeeFilter(role=args.role, min_age=args.min_age, max_age=args.max_age, name_prefix=args.name_prefix)
+
+def run_count(db_manager, args):
+    print(db_manager.count_employees(filters_of(args)))
+    return 0
+
+def run_stats(db_manager, args):
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    writer.writerow(["role", "age_band", "headcount"])
+    writer.writerows(db_manager.get_workforce_stats())
+    return 0
+
+def run_duplicates(db_manager, args):
+    # Likely duplicate employees as CSV, best matches first. With a file, only pairs involving
+    # its (valid) rows are reported.
+    import duplicates
+    import pandas as pd
+    if args.file:
+        with open(args.file, "rb") as upload:
+            rows = [row for batch, _, _, _ in read_import_batches(upload) for row in batch]
+        report = duplicates.find_import_duplicates(db_manager, pd.DataFrame(rows, columns=EMPLOYEE_COLUMNS), args.threshold)
+    else:
+        report = duplicates.scan_database(db_manager, args.threshold)
+    report.to_csv(sys.stdout, index=False, lineterminator="\n")
+    print(f"{len(report):,} likely duplicate pairs", file=sys.stderr)
+    return 0
+
+def describe_backup(result):
+    return (f"{result.path}: {result.pages:,} pages in {result.steps} steps, {result.bytes:,} bytes, "
+            f"{result.seconds:.2f}s; longest step {result.longest_step * 1000:.1f} ms")
+
+def run_backup(db_manager, args):
+    print(describe_backup(backup.backup(args.db, args.output, compress=args.output.endswith(".gz"))), file=sys.stderr)
+    return 0
+
+def run_snapshot(db_manager, args):
+    if not args.every:
+        print(describe_backup(backup.snapshot(args.db, args.directory, args.keep, args.compress)), file=sys.stderr)
+        return 0
+
+    def report(result):
+        print(describe_backup(result) if isinstance(result, backup.BackupResult) else f"Snapshot failed: {result}",
+              file=sys.stderr, flush=True)
+    scheduler = backup.SnapshotScheduler(args.db, args.directory, args.every, args.keep, args.compress, report).start()
+    try:
+        while not scheduler.wait(1):
+            pass
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
+
+def run_restore(db_manager, args):
+    try:
+        seconds = backup.restore(args.archive, args.db, overwrite=args.force)
+    except FileExistsError:
+        raise SystemExit(f"{args.db} already exists; pass --force to replace it")
+    print(f"Restored {args.db} from {args.archive} in {seconds:.2f}s", file=sys.stderr)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Import, export and query the employee database without a GUI.")
+    parser.add_argument("--db", default="employee.db", help="SQLite database file (default: employee.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="import a file; - reads standard input")
+    command.add_argument("file")
+    command.add_argument("--format", choices=IMPORT_FORMATS, help="file format when the name doesn't say (csv for -)")
+    command.add_argument("--on-conflict", choices=list(CONFLICT_POLICIES), default="skip",
+                         help="what to do with IDs that already exist (default: skip)")
+    command.add_argument("--sync", action="store_true",
+                         help="make the table match the file: unchanged rows are left alone, missing ones removed")
+    command.set_defaults(run=run_import)
+
+    command = commands.add_parser("export", help="export every employee")
+    command.add_argument("-o", "--output", help="output file (default: standard output)")
+    command.add_argument("--format", choices=EXPORT_FORMATS, help="default: from the output name, else csv")
+    command.set_defaults(run=run_export)
+
+    command = commands.add_parser("changes", help="CSV of rows changed since a watermark")
+    command.add_argument("--since", type=int, default=0)
+    command.add_argument("--upto", type=int, help="default: the current watermark")
+    command.add_argument("-o", "--output", help="output file (default: standard output)")
+    command.set_defaults(run=run_changes)
+
+    command = commands.add_parser("trim", help="drop change log entries every delta consumer has synced past")
+    command.add_argument("--upto", type=int, required=True, help="oldest watermark any consumer still starts from")
+    command.set_defaults(run=run_trim)
+
+    command = commands.add_parser("search", help="employees whose ID, name or role contains the query")
+    command.add_argument("query")
+    command.add_argument("--limit", type=int, default=-1)
+    command.set_defaults(run=run_search)
+
+    command = commands.add_parser("count", help="number of employees matching the filters")
+    command.add_argument("--role")
+    command.add_argument("--min-age", type=int)
+    command.add_argument("--max-age", type=int)
+    command.add_argument("--name-prefix")
+    command.set_defaults(run=run_count)
+
+    command = commands.add_parser("stats", help="headcount by role and age band")
+    command.set_defaults(run=run_stats)
+
+    command = commands.add_parser("duplicates", help="likely duplicate employees: the same person under two IDs")
+    command.add_argument("--file", help="check an import file against the database instead of scanning it")
+    command.add_argument("--threshold", type=float, default=0.75, help="minimum match score, 0-1 (default: 0.75)")
+    command.set_defaults(run=run_duplicates)
+
+    # These work on the database file and never open it through the storage layer
+    command = commands.add_parser("backup", help="online copy of the database, safe while it is in use")
+    command.add_argument("output", help="backup file; .gz compresses it")
+    command.set_defaults(run=run_backup, file_only=True)
+
+    command = commands.add_parser("snapshot", help="timestamped backup into a directory, keeping the newest few")
+    command.add_argument("directory")
+    command.add_argument("--keep", type=int, default=backup.DEFAULT_KEEP, help="snapshots to keep (default: 7)")
+    command.add_argument("--compress", action="store_true", help="gzip each snapshot")
+    command.add_argument("--every", type=float, help="keep running, taking a snapshot every this many seconds")
+    command.set_defaults(run=run_snapshot, file_only=True)
+
+    command = commands.add_parser("restore", help="rebuild the database from a backup or snapshot")
+    command.add_argument("archive")
+    command.add_argument("--force", action="store_true",
+                         help="replace an existing database; stop everything using it first")
+    command.set_defaults(run=run_restore, file_only=True)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "file_only", False):
+        return args.run(None, args)
+    db_manager = DatabaseManager(args.db)
+    try:
+        return args.run(db_manager, args)
+    except BrokenPipeError:
+        # Reader went away (e.g. piped into head); nothing left to report
+        sys.stderr.close()
+        return 0
+    finally:
+        db_manager.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
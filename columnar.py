@@ -0,0 +1,140 @@
+import glob
+import os
+import re
+import threading
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar formats and snapshots are simply unavailable
+    pa = pq = None
+
+PARQUET_EXTENSIONS = (".parquet",)
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+BATCH_ROWS = 50_000
+
+def available():
+    return pa is not None
+
+def is_columnar(file_name):
+    return file_name.lower().endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS)
+
+def roster_schema(db_manager):
+    # Typed like the table; ages stay text when legacy rows hold values that never converted
+    age_type = pa.string() if db_manager.has_untyped_ages() else pa.int64()
+    return pa.schema([pa.field(column, age_type if column == "age" else pa.string())
+                      for column in db_manager.get_column_names()])
+
+def record_batches(db_manager, schema):
+    for rows in db_manager.iter_employees(BATCH_ROWS):
+        arrays = []
+        for field, values in zip(schema, zip(*rows)):
+            if pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def read_batches(file, file_name, batch_rows=BATCH_ROWS):
+    # Yields (DataFrame chunk, fraction read) from a Parquet or Arrow IPC file
+    if file_name.lower().endswith(PARQUET_EXTENSIONS):
+        parquet = pq.ParquetFile(file)
+        total = parquet.metadata.num_rows
+        batches = parquet.iter_batches(batch_size=batch_rows)
+    else:
+        reader = pa.ipc.open_file(file)
+        total = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    done = 0
+    for batch in batches:
+        done += batch.num_rows
+        yield batch.to_pandas(), done / total if total else 1.0
+
+def read_table(file, file_name):
+    if file_name.lower().endswith(PARQUET_EXTENSIONS):
+        return pq.read_table(file).to_pandas()
+    return pa.ipc.open_file(file).read_all().to_pandas()
+
+def write_parquet_export(db_manager, out):
+    pq.write_table(roster_table(db_manager), out)
+
+def write_arrow_export(db_manager, out):
+    table = roster_table(db_manager)
+    with pa.ipc.new_file(out, table.schema) as writer:
+        writer.write_table(table)
+
+class RosterSnapshot:
+    # Arrow IPC copy of the roster, memory-mapped so loading it is zero-copy. Each file is named
+    # after the database generation it was taken at, so a stale one is never served.
+    def __init__(self, db_name):
+        self.prefix = os.path.splitext(db_name)[0] + ".snapshot"
+        self.table = None
+        self.generation = None
+        self._lock = threading.Lock()
+
+    def _path(self, generation):
+        return f"{self.prefix}.{generation}.arrow"
+
+    def _files(self):
+        pattern = re.compile(re.escape(os.path.basename(self.prefix)) + r"\.(\d+)\.arrow$")
+        found = {}
+        for path in glob.glob(glob.escape(self.prefix) + ".*.arrow"):
+            match = pattern.search(os.path.basename(path))
+            if match:
+                found[int(match.group(1))] = path
+        return found
+
+    def load(self):
+        # Map the newest snapshot on disk; the table's buffers point straight into the page cache
+        files = self._files()
+        if not files:
+            return False
+        generation = max(files)
+        try:
+            table = pa.ipc.open_file(pa.memory_map(files[generation])).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return False
+        self.table, self.generation = table, generation
+        return True
+
+    def write(self, db_manager):
+        # The generation is read before the scan, so a write during it leaves the file looking
+        # stale rather than current
+        generation = db_manager.generation()
+        schema = roster_schema(db_manager)
+        path = self._path(generation)
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in record_batches(db_manager, schema):
+                writer.write_batch(batch)
+        os.replace(tmp_path, path)
+        self.table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        self.generation = generation
+        self._remove_older(generation)
+
+    def _remove_older(self, generation):
+        for older, path in self._files().items():
+            if older < generation:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # Still mapped somewhere (Windows); removed next time
+
+    def current(self, db_manager):
+        with self._lock:
+            generation = db_manager.generation()
+            if self.generation != generation and not (self.load() and self.generation == generation):
+                self.write(db_manager)
+            return self.table
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def get_snapshot(db_name):
+    with _snapshots_lock:
+        if db_name not in _snapshots:
+            _snapshots[db_name] = RosterSnapshot(db_name)
+        return _snapshots[db_name]
+
+def roster_table(db_manager):
+    # The whole roster as an Arrow table, from the snapshot when it is current
+    return get_snapshot(db_manager.db_name).current(db_manager)
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+from instrumentation import measured
+from storage import EMPLOYEE_COLUMNS
+
+# Likely duplicate employees: the same person under two IDs with slightly different names.
+# Comparing every pair is O(n^2), so candidate pairs come from blocking keys instead (shared name
+# tokens, shared phonetic codes, and neighbours in sorted name order) and only those are scored,
+# in vectorized batches.
+
+# Blocks bigger than this (a very common first name, say) are too unselective to be worth pairing
+MAX_BLOCK_SIZE = 50
+# Sorted-neighbourhood window: each record is paired with this many names after it
+WINDOW = 5
+MIN_TOKEN_LENGTH = 2
+# Names are compared on their first MAX_NAME_CHARS characters, as character bigrams
+MAX_NAME_CHARS = 48
+SIGNATURE_SIZE = 64
+SIGNATURE_CHUNK = 20_000
+PAIR_BATCH = 200_000
+DEFAULT_THRESHOLD = 0.75
+# Weighted score; the name carries most of it so same-age, same-role strangers stay apart
+NAME_WEIGHT, AGE_WEIGHT, ROLE_WEIGHT = 0.7, 0.15, 0.15
+
+REPORT_COLUMNS = ["score", "name_similarity", "id_a", "name_a", "age_a", "role_a", "id_b", "name_b", "age_b", "role_b"]
+
+SOUNDEX_CODES = {**dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+                 "l": "4", **dict.fromkeys("mn", "5"), "r": "6"}
+
+def soundex(token):
+    # American Soundex: first letter plus three digits, e.g. Smith and Smyth are both s530
+    if not token or not token[0].isalpha():
+        return token
+    code, previous = token[0], SOUNDEX_CODES.get(token[0])
+    for char in token[1:]:
+        digit = SOUNDEX_CODES.get(char)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if char not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+def name_tokens(names):
+    # Accents dropped, lowercased, punctuation removed, tokens sorted so word order doesn't matter
+    text = (pd.Series(names, dtype=object).fillna("").astype(str)
+            .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+            .str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip())
+    return text.str.split().map(sorted)
+
+def _pairs_within_blocks(records, keys, max_block):
+    # Every pair of records sharing a key, for keys held by at most max_block records. Sorting by
+    # key puts each block in one run, and a block's pairs are the (i, i + d) within that run.
+    codes, uniques = pd.factorize(keys)
+    if not len(uniques):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    sizes = np.bincount(codes)
+    keep = (codes >= 0) & (sizes[codes] <= max_block) & (sizes[codes] > 1)
+    codes, records = codes[keep], records[keep]
+    order = np.argsort(codes, kind="stable")
+    codes, records = codes[order], records[order]
+    left, right = [], []
+    for d in range(1, max_block):
+        same = codes[:-d] == codes[d:]
+        if not same.any():
+            break
+        left.append(records[:-d][same])
+        right.append(records[d:][same])
+    if not left:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+def _pairs_in_window(sort_keys, window):
+    order = np.argsort(np.asarray(sort_keys, dtype=object), kind="stable")
+    left = [order[:-d] for d in range(1, min(window, len(order) - 1) + 1)]
+    right = [order[d:] for d in range(1, min(window, len(order) - 1) + 1)]
+    if not left:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+def candidate_pairs(tokens, window=WINDOW, max_block=MAX_BLOCK_SIZE):
+    # Unique (a, b) record positions, a < b, that share at least one blocking key
+    exploded = tokens.explode()
+    exploded = exploded[exploded.notna() & (exploded.str.len() >= MIN_TOKEN_LENGTH)]
+    records = exploded.index.to_numpy(dtype=np.int64)
+    words = exploded.to_numpy(dtype=object)
+    phonetic = pd.Series(words, dtype=object).map(soundex).to_numpy(dtype=object)
+    pairs = [
+        _pairs_within_blocks(records, words, max_block),
+        _pairs_within_blocks(records, phonetic, max_block),
+        # Sorted on the tokens in order and in reverse, so a typo in either word of a two-word
+        # name still leaves the pair next to each other in one of the orders
+        _pairs_in_window(tokens.str.join(" ").to_numpy(dtype=object), window),
+        _pairs_in_window(tokens.map(lambda words: " ".join(reversed(words))).to_numpy(dtype=object), window),
+        # Reversed characters, for typos in the first letters of the last word
+        _pairs_in_window(tokens.str.join(" ").str[::-1].to_numpy(dtype=object), window),
+    ]
+    a = np.concatenate([pair[0] for pair in pairs]).astype(np.int64)
+    b = np.concatenate([pair[1] for pair in pairs]).astype(np.int64)
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    distinct = a != b
+    n = len(tokens)
+    encoded = np.unique(a[distinct] * n + b[distinct])
+    return encoded // n, encoded % n
+
+def name_signatures(joined):
+    # MinHash over character bigrams: the share of equal signature slots estimates the Jaccard
+    # similarity of two names' bigram multisets. Names become fixed-width byte rows so bigrams and
+    # hashes are computed column-wise.
+    width = MAX_NAME_CHARS + 2
+    padded = (" " + joined.str.slice(0, MAX_NAME_CHARS) + " ").to_numpy(dtype=f"S{width}")
+    chars = padded.view(np.uint8).reshape(len(padded), width).astype(np.uint64)
+    lengths = np.char.str_len(padded)
+    bigrams = (chars[:, :-1] << np.uint64(8)) | chars[:, 1:]
+    past_end = np.arange(width - 1)[None, :] >= (lengths - 1)[:, None]
+    bigrams = np.sort(np.where(past_end, np.uint64(2 ** 64 - 1), bigrams), axis=1)
+    # Number repeats of a bigram (the second "00" in "1000" is its own element), so names that
+    # differ only in how often something repeats aren't identical sets
+    positions = np.arange(width - 1)
+    starts = np.concatenate([np.ones((len(padded), 1), bool), bigrams[:, 1:] != bigrams[:, :-1]], axis=1)
+    repeat = positions - np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    bigrams = bigrams | (repeat.astype(np.uint64) << np.uint64(16))
+    # Positions past the end repeat the row's first bigram, which leaves its minimum unchanged
+    bigrams = np.where(np.sort(past_end, axis=1), bigrams[:, :1], bigrams)
+    rng = np.random.default_rng(0x5EED)
+    multipliers = rng.integers(1, 2 ** 63, SIGNATURE_SIZE, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, SIGNATURE_SIZE, dtype=np.uint64)
+    signatures = np.empty((len(padded), SIGNATURE_SIZE), dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        for start in range(0, len(padded), SIGNATURE_CHUNK):
+            block = bigrams[start:start + SIGNATURE_CHUNK]
+            for slot in range(SIGNATURE_SIZE):
+                # Multiply-shift hashing; wrapping uint64 arithmetic is the point
+                signatures[start:start + SIGNATURE_CHUNK, slot] = (block * multipliers[slot] + offsets[slot]).min(axis=1) >> np.uint64(32)
+    return signatures
+
+def score_pairs(frame, signatures, a, b):
+    # -> (score, name similarity) for each pair, PAIR_BATCH pairs at a time
+    ages = pd.to_numeric(frame["age"], errors="coerce").to_numpy(dtype=float)
+    roles = frame["role"].astype(object).where(frame["role"].notna(), None).map(
+        lambda role: None if role is None else str(role).strip().lower()).to_numpy(dtype=object)
+    scores = np.empty(len(a))
+    names = np.empty(len(a))
+    for start in range(0, len(a), PAIR_BATCH):
+        left, right = a[start:start + PAIR_BATCH], b[start:start + PAIR_BATCH]
+        name = (signatures[left] == signatures[right]).mean(axis=1)
+        gap = np.abs(ages[left] - ages[right])
+        # Ages a year apart are the same person filling the form at different times; unknown is neutral
+        age = np.where(np.isnan(gap), 0.5, np.where(gap <= 1, 1.0, np.where(gap <= 3, 0.5, 0.0)))
+        role_left, role_right = roles[left], roles[right]
+        known = pd.notna(role_left) & pd.notna(role_right)
+        role = np.where(known, (role_left == role_right).astype(float), 0.5)
+        scores[start:start + PAIR_BATCH] = NAME_WEIGHT * name + AGE_WEIGHT * age + ROLE_WEIGHT * role
+        names[start:start + PAIR_BATCH] = name
+    return scores, names
+
+@measured(rows=len)
+def find_duplicates(frame, threshold=DEFAULT_THRESHOLD, new=None):
+    # frame has id, name, age and role columns. With new (a boolean mask over frame), only pairs
+    # involving at least one new row are reported. Returns REPORT_COLUMNS, best matches first.
+    frame = frame[EMPLOYEE_COLUMNS].reset_index(drop=True)
+    if len(frame) < 2:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    tokens = name_tokens(frame["name"])
+    a, b = candidate_pairs(tokens)
+    ids = frame["id"].astype(str).to_numpy(dtype=object)
+    named = (tokens.str.len() > 0).to_numpy()
+    keep = (ids[a] != ids[b]) & named[a] & named[b]
+    if new is not None:
+        new = np.asarray(new, dtype=bool)
+        keep &= new[a] | new[b]
+    a, b = a[keep], b[keep]
+    scores, names = score_pairs(frame, name_signatures(tokens.str.join(" ")), a, b)
+    match = scores >= threshold
+    a, b = a[match], b[match]
+    left, right = frame.iloc[a].reset_index(drop=True), frame.iloc[b].reset_index(drop=True)
+    report = pd.DataFrame({"score": scores[match].round(3), "name_similarity": names[match].round(3)})
+    for side, rows in (("a", left), ("b", right)):
+        for column in EMPLOYEE_COLUMNS:
+            report[f"{column}_{side}"] = rows[column].to_numpy(dtype=object)
+    return report[REPORT_COLUMNS].sort_values(["score", "id_a", "id_b"], ascending=[False, True, True],
+                                              ignore_index=True)
+
+def roster_frame(db_manager):
+    rows = [row[:len(EMPLOYEE_COLUMNS)] for batch in db_manager.iter_employees(50_000) for row in batch]
+    return pd.DataFrame(rows, columns=EMPLOYEE_COLUMNS)
+
+def scan_database(db_manager, threshold=DEFAULT_THRESHOLD):
+    return find_duplicates(roster_frame(db_manager), threshold)
+
+def find_import_duplicates(db_manager, incoming, threshold=DEFAULT_THRESHOLD):
+    # Rows of an import that look like an employee already on file, or like each other. Rows
+    # whose ID is already on file are ID conflicts, not duplicates, so their stored copy is left out.
+    incoming = incoming[EMPLOYEE_COLUMNS].astype(object)
+    existing = roster_frame(db_manager)
+    existing = existing[~existing["id"].isin(incoming["id"].astype(str))]
+    frame = pd.concat([existing, incoming], ignore_index=True)
+    # Stored rows come first in frame and pairs are ordered by position, so a mixed pair always
+    # has the stored row as "a"
+    return find_duplicates(frame, threshold, new=np.arange(len(frame)) >= len(existing))
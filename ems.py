@@ -1,9 +1,21 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import re
 import io
-from openpyxl import Workbook
+import functools
+import os
+import sqlite3
+import tempfile
+import time
+
+import backup
+import columnar
+import duplicates
+from exports import write_csv_export, write_delta_export, write_excel_export, write_text_export
+from importer import IMPORT_CHUNK_ROWS, ImportJob, import_writer, read_import_batches, read_upload
+from instrumentation import Metrics, measured, timed
+from roster import Roster
+from storage import CONFLICT_POLICIES, EMPLOYEE_COLUMNS, PAGE_SORT_KEYS, DatabaseManager, EmployeeFilter
+from validation import AGE_NUMBER_ERROR, AGE_RANGE_ERROR, normalize_column_name, validate_imported_data, validate_inputs
 
 # Set up the page metadata
 st.set_page_config(
@@ -13,116 +25,287 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-class DatabaseManager:
-    def __init__(self, db_name='employee.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
-        self.recreate_table()
+PAGE_SIZES = [25, 50, 100, 500]
 
-    def recreate_table(self):
-        self.cursor.execute("DROP TABLE IF EXISTS employees")
-        self.cursor.execute('''CREATE TABLE employees
-                              (id TEXT PRIMARY KEY, name TEXT, age INTEGER, role TEXT)''')
-        self.conn.commit()
+# Uploads larger than this default to the chunked streaming import
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+UPLOAD_TYPES = ["csv", "xlsx", "txt"] + (["parquet", "arrow", "feather"] if columnar.available() else [])
 
-    def get_column_names(self):
-        self.cursor.execute("PRAGMA table_info(employees)")
-        return [info[1] for info in self.cursor.fetchall()]
+IMPORT_OUTCOMES = {
+    "inserted": "Imported",
+    "replaced": "Replaced existing record",
+    "skipped": "Skipped: ID already exists",
+    "conflicted": "Failed: ID already exists",
+}
 
-    def insert_employee(self, details):
-        try:
-            self.cursor.execute("INSERT INTO employees (id, name, age, role) VALUES (?, ?, ?, ?)", details)
-            self.conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False
+@st.cache_resource
+def get_db_manager():
+    # One engine per server process, shared by every session and rerun
+    db_manager = DatabaseManager()
+    if columnar.available():
+        # Map the last roster snapshot now, so the first columnar export doesn't rescan the table
+        columnar.get_snapshot(db_manager.db_name).load()
+    return db_manager
 
-    def update_employee(self, id, details):
-        try:
-            self.cursor.execute("UPDATE employees SET name=?, age=?, role=? WHERE id=?", 
-                               (details[1], details[2], details[3], id))
-            self.conn.commit()
-            return self.conn.total_changes > 0
-        except sqlite3.Error:
-            return False
-
-    def delete_employee(self, employee_id):
-        self.cursor.execute("DELETE FROM employees WHERE id=?", (employee_id,))
-        self.conn.commit()
-        return self.conn.total_changes > 0
-
-    def get_employees(self):
-        self.cursor.execute("SELECT * FROM employees")
-        return self.cursor.fetchall()
-
-    def search_employees(self, query):
-        query = f"%{query}%"
-        self.cursor.execute("SELECT * FROM employees WHERE name LIKE ? OR id LIKE ?", (query, query))
-        return self.cursor.fetchall()
-
-def normalize_column_name(col):
-    col = col.lower().strip()
-    mapping = {
-        'id': ['id', 'employee id', 'emp id', 'identifier'],
-        'name': ['name', 'employee name', 'full name', 'person'],
-        'age': ['age', 'years', 'employee age'],
-        'role': ['role', 'position', 'job title', 'title', 'occupation']
-    }
-    for standard, variations in mapping.items():
-        if col in variations or col.replace(' ', '') in [v.replace(' ', '') for v in variations]:
-            return standard
-    return col
-
-def validate_inputs(id, name, age, role):
-    errors = []
-    if not id or not isinstance(id, str) or not re.match(r'^[a-zA-Z0-9-]+$', id):
-        errors.append("ID must be non-empty and alphanumeric (hyphens allowed).")
-    if not name or not isinstance(name, str) or len(name.strip()) < 2:
-        errors.append("Name must be at least 2 characters long.")
-    try:
-        age = int(age)
-        if not (18 <= age <= 100):
-            errors.append("Age must be a number between 18 and 100.")
-    except (ValueError, TypeError):
-        errors.append("Age must be a valid number.")
-    if not role or not isinstance(role, str):
-        errors.append("Role must be specified.")
-    return errors
-
-def validate_imported_data(df):
-    expected_columns = ["id", "name", "age", "role"]
-    # Normalize column names
-    df.columns = [normalize_column_name(col) for col in df.columns]
-    
-    # Check for required columns
-    missing_cols = [col for col in expected_columns if col not in df.columns]
-    if missing_cols:
-        return False, [f"Missing required columns: {', '.join(missing_cols)}"], df
-    
-    # Keep only the required columns
-    df = df[expected_columns]
-    
-    # Clean data
-    df = df.fillna('')  # Replace NaN with empty string
-    df['id'] = df['id'].astype(str).str.strip()
-    df['name'] = df['name'].astype(str).str.strip()
-    df['role'] = df['role'].astype(str).str.strip()
-    
-    errors = []
-    valid_rows = []
-    statuses = []
-    for index, row in df.iterrows():
-        row_errors = validate_inputs(row['id'], row['name'], row['age'], row['role'])
-        if row_errors:
-            errors.append(f"Row {index + 1}: {', '.join(row_errors)}")
-            statuses.append(f"Failed: {', '.join(row_errors)}")
+def start_import_job(db_manager, uploaded_file, on_conflict="skip", chunksize=IMPORT_CHUNK_ROWS):
+    # The job reads its own view of the upload, so reruns can't move the file position under it
+    upload = io.BytesIO(uploaded_file.getvalue())
+    upload.name = uploaded_file.name
+    upload.size = uploaded_file.size
+    return ImportJob(read_import_batches(upload, chunksize),
+                     functools.partial(import_writer, db_manager, on_conflict)).start()
+
+def show_import_job(job):
+    # Poll the background job until it finishes. A rerun (e.g. the Cancel button) stops
+    # this loop but not the job, which picks up again on the next run.
+    progress_bar = st.progress(job.fraction, text="Starting import...")
+    counter = st.empty()
+    st.button("Cancel import", on_click=job.cancel, disabled=job.finished)
+    while True:
+        job.poll()
+        progress_bar.progress(job.fraction, text=f"Processed {job.totals['rows']:,} rows")
+        counter.markdown(f"✅ {job.totals['imported']:,} imported &nbsp; ⚠️ {job.totals['skipped']:,} skipped "
+                         f"&nbsp; ❌ {job.totals['failed']:,} errors")
+        if job.finished:
+            break
+        time.sleep(0.2)
+
+    totals = job.totals
+    if job.outcome == "completed":
+        progress_bar.progress(1.0, text=f"Processed {totals['rows']:,} rows")
+    if totals["imported"] > 0:
+        st.success(f"Successfully imported {totals['imported']:,} out of {totals['rows']:,} records.")
+    if job.outcome == "cancelled":
+        st.warning("Import cancelled. Rows written before cancelling were kept.")
+    elif job.outcome == "stopped":
+        st.error(job.message)
+    elif job.outcome == "failed":
+        st.error(f"Error processing file: {job.message}")
+    for error in job.errors:
+        st.error(error)
+    if totals["failed"] > len(job.errors):
+        st.error(f"... and {totals['failed'] - len(job.errors):,} more errors.")
+
+def apply_import_report(df, report):
+    # Turn the per-ID bulk import report back into per-row statuses
+    outcomes = {}
+    for outcome, label in IMPORT_OUTCOMES.items():
+        for employee_id in report[outcome]:
+            outcomes[employee_id] = label
+    fallback = "Not imported: import cancelled" if report["conflicted"] else "Not imported"
+    valid = df['Status'] == "Success"
+    df.loc[valid, 'Status'] = df.loc[valid, 'id'].map(outcomes).fillna(fallback)
+    return df
+
+# Format -> (button label, file name, mime type, writer)
+EXPORT_FORMATS = {
+    "csv": ("Download as CSV", "employees.csv", "text/csv", write_csv_export),
+    "xlsx": ("Download as Excel", "employees.xlsx",
+             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_excel_export),
+    "txt": ("Download as TXT", "employees.txt", "text/plain", write_text_export),
+}
+if columnar.available():
+    EXPORT_FORMATS["parquet"] = ("Download as Parquet", "employees.parquet", "application/vnd.apache.parquet",
+                                 columnar.write_parquet_export)
+    EXPORT_FORMATS["arrow"] = ("Download as Arrow", "employees.arrow", "application/vnd.apache.arrow.file",
+                               columnar.write_arrow_export)
+
+@st.cache_data(max_entries=len(EXPORT_FORMATS), show_spinner="Preparing export...")
+def build_export(_db_manager, fmt, data_version, db_name):
+    # Cached per format and data version, so a file is only rebuilt after the table changes
+    out = io.BytesIO()
+    with timed(f"export_{fmt}") as call:
+        EXPORT_FORMATS[fmt][3](_db_manager, out)
+        call.rows = _db_manager.count_employees()
+    return out.getvalue()
+
+@st.cache_data(max_entries=8, show_spinner="Preparing changes...")
+def build_delta_export(_db_manager, since, upto, db_name):
+    # upto pins the content: every write moves the watermark
+    out = io.BytesIO()
+    with timed("export_delta"):
+        write_delta_export(_db_manager, out, since, upto)
+    return out.getvalue()
+
+@st.cache_data(max_entries=1, show_spinner="Backing up...")
+def build_backup(db_name, data_version):
+    # Online backup API rather than a pandas export; kept until the data version moves
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "backup.db.gz")
+        backup.backup(db_name, path, compress=True)
+        with open(path, "rb") as f:
+            return f.read()
+
+def show_duplicate_report(db_manager, df):
+    valid_rows, _, _ = validate_imported_data(df.copy())
+    if not valid_rows:
+        st.info("No valid rows to check.")
+        return
+    with timed("import_duplicate_check") as call:
+        report = duplicates.find_import_duplicates(db_manager, pd.DataFrame(valid_rows, columns=EMPLOYEE_COLUMNS))
+        call.rows = len(valid_rows)
+    if report.empty:
+        st.success("No likely duplicates found.")
+        return
+    st.warning(f"{len(report):,} likely duplicate pairs. Where one side is already on file, it is A and "
+               "the imported row is B.")
+    st.dataframe(report, use_container_width=True, hide_index=True)
+
+def reset_pages():
+    st.session_state["page_cursors"] = [None]
+
+BULK_ACTIONS = ["Update matching employees", "Delete matching employees", "Delete a list of IDs"]
+
+def bulk_filter_inputs(db_manager):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        role = st.selectbox("Role", ["Any", *db_manager.get_roles()], key="bulk_role")
+    with col2:
+        min_age, max_age = st.slider("Age", 18, 100, (18, 100), key="bulk_age")
+    with col3:
+        name_prefix = st.text_input("Name starts with", key="bulk_name_prefix", help="Case-sensitive")
+    return EmployeeFilter(role=None if role == "Any" else role,
+                          min_age=None if min_age == 18 else min_age,
+                          max_age=None if max_age == 100 else max_age,
+                          name_prefix=name_prefix or None)
+
+def read_id_list(text, uploaded_file):
+    # One id per line, plus the id column (or else the first column) of an uploaded file
+    ids = [line.strip() for line in text.splitlines() if line.strip()]
+    if uploaded_file:
+        df = read_upload(uploaded_file)
+        df.columns = [normalize_column_name(str(col)) for col in df.columns]
+        column = df["id"] if "id" in df.columns else df.iloc[:, 0]
+        ids += column.dropna().astype(str).str.strip().tolist()
+    return ids
+
+def show_bulk_actions(db_manager):
+    # Every action is counted with a dry run first and applied as one set-based statement
+    action = st.radio("Action", BULK_ACTIONS, horizontal=True, key="bulk_action")
+    if action == "Delete a list of IDs":
+        text = st.text_area("IDs, one per line", key="bulk_ids")
+        id_file = st.file_uploader("Or a file with an id column", type=UPLOAD_TYPES, key="bulk_id_file")
+        ids = read_id_list(text, id_file)
+        if not ids:
+            return
+        apply = functools.partial(db_manager.delete_many, ids)
+        verb = "deleted"
+    else:
+        filters = bulk_filter_inputs(db_manager)
+        if filters == EmployeeFilter():
+            st.warning("No filter set: this matches every employee.")
+        if action == "Delete matching employees":
+            apply = functools.partial(db_manager.delete_where, filters)
+            verb = "deleted"
         else:
-            valid_rows.append((row['id'], row['name'], int(row['age']), row['role']))
-            statuses.append("Success")
-    
-    df['Status'] = statuses
-    return valid_rows, errors, df
+            col1, col2 = st.columns(2)
+            with col1:
+                new_role = st.text_input("Set role to", key="bulk_new_role").strip()
+            with col2:
+                new_age = st.text_input("Set age to", key="bulk_new_age").strip()
+            changes = {}
+            if new_role:
+                changes["role"] = new_role
+            if new_age:
+                try:
+                    changes["age"] = int(new_age)
+                except ValueError:
+                    st.error(AGE_NUMBER_ERROR)
+                    return
+                if not 18 <= changes["age"] <= 100:
+                    st.error(AGE_RANGE_ERROR)
+                    return
+            if not changes:
+                return
+            apply = functools.partial(db_manager.update_where, filters, changes)
+            verb = "updated"
+
+    count = apply(dry_run=True)
+    st.caption(f"{count:,} employees would be {verb}.")
+    # Keyed on what is being confirmed, so a different action or count needs confirming again
+    confirmed = st.checkbox(f"Yes, {verb[:-1]} {count:,} employees", key=f"bulk_confirm_{action}_{count}")
+    if st.button("Apply", disabled=not (count and confirmed), key="bulk_apply"):
+        try:
+            done = apply()
+        except sqlite3.Error as e:
+            st.error(f"No employees were {verb}: {e}")
+            return
+        reset_pages()
+        st.success(f"{done:,} employees {verb}.")
+
+def age_band_label(band):
+    return "Unknown" if band < 0 else f"{band}–{band + 9}"
+
+def show_analytics(db_manager):
+    # Everything here comes from the trigger-maintained summary, never a scan of employees
+    stats = pd.DataFrame(db_manager.get_workforce_stats(), columns=["role", "age_band", "headcount"])
+    if stats.empty:
+        st.warning("No employees to analyze.")
+        return
+    stats["role"] = stats["role"].replace("", "(none)")
+    # Decades in order, with ages that aren't numbers at the end
+    bands = sorted(stats["age_band"].unique(), key=lambda band: (band < 0, band))
+    labels = [age_band_label(band) for band in bands]
+    stats["age_band"] = stats["age_band"].map(age_band_label)
+
+    by_role = stats.groupby("role")["headcount"].sum().sort_values(ascending=False)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Headcount", f"{by_role.sum():,}")
+    col2.metric("Roles", f"{len(by_role):,}")
+    col3.metric("Largest role", by_role.index[0])
+
+    st.subheader("Headcount by Role")
+    st.bar_chart(by_role)
+
+    st.subheader("Age Distribution")
+    st.bar_chart(stats.groupby("age_band")["headcount"].sum().reindex(labels))
+
+    st.subheader("Role by Age Band")
+    pivot = stats.pivot_table(index="role", columns="age_band", values="headcount", aggfunc="sum", fill_value=0)
+    st.dataframe(pivot.reindex(columns=labels, fill_value=0).loc[by_role.index], use_container_width=True)
+
+def diagnostics_enabled():
+    # Hidden unless the URL has ?diagnostics=1 or EMS_DIAGNOSTICS is set
+    return st.query_params.get("diagnostics") == "1" or bool(os.environ.get("EMS_DIAGNOSTICS"))
+
+def show_diagnostics(db_manager):
+    recorder = db_manager.instruments
+    if not isinstance(recorder, Metrics):
+        st.info("No in-memory metrics are being recorded.")
+        return
+    gauges = db_manager.diagnostics_gauges()
+
+    st.subheader("Call latency")
+    summary = recorder.summary()
+    if summary:
+        st.dataframe(pd.DataFrame(summary).round(2), use_container_width=True, hide_index=True)
+    else:
+        st.info("Nothing recorded yet.")
+
+    snapshot = recorder.snapshot()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Commits", f"{snapshot['counters'].get('commits', 0):,}")
+    col2.metric("Result cache hits", f"{gauges['result_cache_hits']:,}")
+    col3.metric("Result cache misses", f"{gauges['result_cache_misses']:,}")
+
+    st.subheader(f"Slow calls (over {recorder.slow_seconds * 1000:.0f} ms)")
+    if not snapshot["slow_calls"]:
+        st.caption("None so far.")
+    for sample in reversed(snapshot["slow_calls"]):
+        with st.expander(f"{sample['call']} · {sample['seconds'] * 1000:.1f} ms · {sample['rows'] or 0:,} rows"):
+            for statement in sample["statements"]:
+                st.code(statement["sql"], language="sql")
+                if statement["plan"]:
+                    st.code("\n".join(statement["plan"]), language="text")
+
+    col4, col5 = st.columns(2)
+    with col4:
+        st.download_button("Download Prometheus metrics", recorder.to_prometheus(gauges),
+                           file_name="ems_metrics.prom", mime="text/plain")
+    with col5:
+        st.button("Reset metrics", on_click=recorder.reset)
 
+@measured(name="script_run")
 def main():
     # Load custom CSS
     try:
@@ -157,14 +340,17 @@ def main():
             </div>
         """, unsafe_allow_html=True)
 
-    db_manager = DatabaseManager()
+    db_manager = get_db_manager()
     columns = db_manager.get_column_names()
-    expected_columns = ["id", "name", "age", "role"]
-    if columns != expected_columns:
-        st.warning(f"Database schema mismatch. Expected columns: {expected_columns}, Found: {columns}")
+    # Imports may add their own columns after the four every front end relies on
+    if columns[:len(EMPLOYEE_COLUMNS)] != EMPLOYEE_COLUMNS:
+        st.warning(f"Database schema mismatch. Expected columns to start with: {EMPLOYEE_COLUMNS}, Found: {columns}")
 
     # Tabs for different functionalities
-    tab1, tab2, tab3, tab4 = st.tabs(["Manage Employees", "View & Search", "Export Data", "Import Data"])
+    tab_names = ["Manage Employees", "View & Search", "Export Data", "Import Data", "Analytics"]
+    if diagnostics_enabled():
+        tab_names.append("Diagnostics")
+    tab1, tab2, tab3, tab4, tab5, *diagnostics_tab = st.tabs(tab_names)
 
     with tab1:
         st.subheader("Manage Employee Records")
@@ -192,17 +378,19 @@ def main():
                         st.error(error)
                 else:
                     employee_data = (id, name, int(age), role)
-                    if db_manager.insert_employee(employee_data):
-                        st.success("Employee added successfully!")
-                    else:
-                        st.error("Failed to add employee. ID may already exist.")
+                    try:
+                        if db_manager.insert_employee(employee_data):
+                            st.success("Employee added successfully!")
+                        else:
+                            st.error("Failed to add employee. ID may already exist.")
+                    except sqlite3.Error as e:
+                        st.error(f"Failed to add employee: {e}")
 
         st.subheader("Update or Delete Employee")
         update_id = st.text_input("Enter ID to Update/Delete", key="update_id")
         if update_id:
-            employees = db_manager.search_employees(update_id)
-            if employees:
-                emp = employees[0]
+            emp = db_manager.get_employee(update_id)
+            if emp:
                 with st.form("update_form"):
                     u_name = st.text_input("Name", value=emp[1])
                     u_age = st.text_input("Age", value=str(emp[2]))
@@ -219,93 +407,157 @@ def main():
                                 for error in errors:
                                     st.error(error)
                             else:
-                                if db_manager.update_employee(update_id, (update_id, u_name, int(u_age), u_role)):
-                                    st.success("Employee updated successfully!")
-                                else:
-                                    st.error("Failed to update employee.")
+                                try:
+                                    if db_manager.update_employee(update_id, (update_id, u_name, int(u_age), u_role)):
+                                        st.success("Employee updated successfully!")
+                                    else:
+                                        st.error("Failed to update employee. ID not found.")
+                                except sqlite3.Error as e:
+                                    st.error(f"Failed to update employee: {e}")
                     with col6:
                         if st.form_submit_button("Delete"):
-                            if db_manager.delete_employee(update_id):
-                                st.success("Employee deleted successfully!")
-                            else:
-                                st.error("Failed to delete employee. ID not found.")
+                            try:
+                                if db_manager.delete_employee(update_id):
+                                    st.success("Employee deleted successfully!")
+                                else:
+                                    st.error("Failed to delete employee. ID not found.")
+                            except sqlite3.Error as e:
+                                st.error(f"Failed to delete employee: {e}")
             else:
                 st.warning("No employee found with this ID.")
 
+        st.subheader("Bulk Actions")
+        show_bulk_actions(db_manager)
+
     with tab2:
         st.subheader("Employee List")
-        search_query = st.text_input("Search by Name or ID", placeholder="Type to search...")
-        employees = db_manager.search_employees(search_query) if search_query else db_manager.get_employees()
+        search_query = st.text_input("Search by Name, ID or Role", placeholder="Type to search...")
+        col1, col2 = st.columns(2)
+        with col1:
+            sort_key = st.selectbox("Sort by", PAGE_SORT_KEYS, format_func=str.capitalize,
+                                    on_change=reset_pages, disabled=bool(search_query))
+        with col2:
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, on_change=reset_pages)
+
+        # Structured filters, each served by its own index
+        with st.expander("Filters"):
+            col3, col4, col5 = st.columns(3)
+            with col3:
+                role_filter = st.selectbox("Role", ["Any"] + db_manager.get_roles(), on_change=reset_pages,
+                                           disabled=bool(search_query))
+            with col4:
+                min_age, max_age = st.slider("Age", 18, 100, (18, 100), on_change=reset_pages,
+                                             disabled=bool(search_query))
+            with col5:
+                name_prefix = st.text_input("Name starts with", on_change=reset_pages,
+                                            disabled=bool(search_query), help="Case-sensitive")
+        filters = EmployeeFilter(role=None if role_filter == "Any" else role_filter,
+                                 min_age=None if min_age == 18 else min_age,
+                                 max_age=None if max_age == 100 else max_age,
+                                 name_prefix=name_prefix or None)
+
+        if search_query:
+            employees = db_manager.search_employees(search_query, limit=page_size)
+            caption = f"Showing the top {len(employees)} matches."
+        else:
+            # Stack of cursors for the pages visited so far; the last one opens the current page
+            cursors = st.session_state.setdefault("page_cursors", [None])
+            employees, next_cursor = db_manager.get_employees_page(page_size, after=cursors[-1], order_by=sort_key,
+                                                                   filters=filters)
+            total = db_manager.count_employees(filters)
+            caption = f"Page {len(cursors)} of {max(1, -(-total // page_size))} · {total:,} employees"
+
         if employees:
-            df = pd.DataFrame(employees, columns=columns)
-            st.dataframe(df, use_container_width=True)
+            with timed("render_employee_list") as call:
+                df = Roster(employees, columns).to_frame()
+                st.dataframe(df, use_container_width=True)
+                call.rows = len(df)
+            st.caption(caption)
         else:
             st.warning("No employees found.")
 
+        if not search_query:
+            col3, col4 = st.columns(2)
+            with col3:
+                st.button("◀ Previous", on_click=cursors.pop, disabled=len(cursors) == 1)
+            with col4:
+                st.button("Next ▶", on_click=cursors.append, args=(next_cursor,), disabled=next_cursor is None)
+
     with tab3:
         st.subheader("Export Employee Data")
-        employees = db_manager.get_employees()
-        if employees:
-            df = pd.DataFrame(employees, columns=columns)
-
-            # Export as CSV
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="Download as CSV",
-                data=csv,
-                file_name="employees.csv",
-                mime="text/csv"
-            )
+        if db_manager.count_employees():
+            # Files are only generated once asked for, then reused until the data changes
+            fmt = st.radio("Format", list(EXPORT_FORMATS), format_func=str.upper, horizontal=True)
+            if st.button("Prepare export"):
+                st.session_state["export_format"] = fmt
+            if st.session_state.get("export_format") == fmt:
+                label, file_name, mime, _ = EXPORT_FORMATS[fmt]
+                data = build_export(db_manager, fmt, db_manager.data_version(), db_manager.db_name)
+                st.download_button(
+                    label=label,
+                    data=data,
+                    file_name=file_name,
+                    mime=mime
+                )
+        else:
+            st.warning("No data to export.")
 
-            # Export as Excel
-            excel_buffer = io.BytesIO()
-            df.to_excel(excel_buffer, index=False, engine='openpyxl')
-            excel_buffer.seek(0)
-            st.download_button(
-                label="Download as Excel",
-                data=excel_buffer,
-                file_name="employees.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        st.subheader("Export Changes")
+        watermark = db_manager.change_watermark()
+        st.caption(f"Current watermark: {watermark}. Starting from the watermark of your last sync gives only the "
+                   "employees added, changed or deleted since; deletions are rows with only the id set.")
+        since = st.number_input("Changes since watermark", min_value=0, max_value=watermark, value=0, step=1)
+        if st.button("Prepare changes"):
+            st.session_state["delta_since"] = since
+        if st.session_state.get("delta_since") == since:
+            try:
+                data = build_delta_export(db_manager, since, watermark, db_manager.db_name)
+                st.download_button(
+                    label="Download changes as CSV",
+                    data=data,
+                    file_name=f"employees_changes_{since}_{watermark}.csv",
+                    mime="text/csv"
+                )
+            except ValueError as e:
+                st.error(str(e))
 
-            # Export as TXT
-            txt = df.to_string(index=False)
+        st.subheader("Database Backup")
+        st.caption("A compressed copy of the whole database, taken without pausing anyone's edits. "
+                   "Restore it with `python cli.py restore`.")
+        if st.button("Prepare backup"):
+            st.session_state["backup_version"] = db_manager.data_version()
+        if st.session_state.get("backup_version") == db_manager.data_version():
             st.download_button(
-                label="Download as TXT",
-                data=txt,
-                file_name="employees.txt",
-                mime="text/plain"
+                label="Download backup",
+                data=build_backup(db_manager.db_name, db_manager.data_version()),
+                file_name=f"{os.path.splitext(os.path.basename(db_manager.db_name))[0]}.db.gz",
+                mime="application/gzip"
             )
-        else:
-            st.warning("No data to export.")
 
     with tab4:
         st.subheader("Import Employee Data")
         st.markdown("Upload a file in CSV, Excel, or TXT format. Expected columns: id, name, age, role (case-insensitive, variations accepted).")
         
-        uploaded_file = st.file_uploader("Choose a file", type=["csv", "xlsx", "txt"])
+        uploaded_file = st.file_uploader("Choose a file", type=UPLOAD_TYPES)
+
         if uploaded_file:
+            stream = st.checkbox("Stream straight into the database (recommended for large files)",
+                                 value=uploaded_file.size > STREAMING_THRESHOLD_BYTES,
+                                 help="Imports the file chunk by chunk without the editable preview.")
+        if uploaded_file and stream:
+            conflict_policy = st.selectbox("When an ID already exists", list(CONFLICT_POLICIES),
+                                           format_func=CONFLICT_POLICIES.get, key="stream_conflict_policy")
+            if st.button("Import"):
+                previous = st.session_state.get("import_job")
+                if previous:
+                    previous.cancel()
+                st.session_state["import_job"] = start_import_job(db_manager, uploaded_file,
+                                                                  on_conflict=conflict_policy)
+            if st.session_state.get("import_job"):
+                show_import_job(st.session_state["import_job"])
+        elif uploaded_file:
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    try:
-                        df = pd.read_csv(uploaded_file, encoding='utf-8')
-                    except UnicodeDecodeError:
-                        uploaded_file.seek(0)
-                        df = pd.read_csv(uploaded_file, encoding='latin1')
-                elif uploaded_file.name.endswith('.xlsx'):
-                    df = pd.read_excel(uploaded_file, engine='openpyxl')
-                elif uploaded_file.name.endswith('.txt'):
-                    uploaded_file.seek(0)
-                    content = uploaded_file.read().decode('utf-8')
-                    if '\t' in content:
-                        uploaded_file.seek(0)
-                        df = pd.read_table(uploaded_file, sep='\t')
-                    elif ',' in content:
-                        uploaded_file.seek(0)
-                        df = pd.read_table(uploaded_file, sep=',')
-                    else:
-                        uploaded_file.seek(0)
-                        df = pd.read_table(uploaded_file, delim_whitespace=True)
+                df = read_upload(uploaded_file)
 
                 # Validate and import data
                 valid_rows, errors, df_with_status = validate_imported_data(df)
@@ -314,28 +566,50 @@ def main():
                 st.subheader("Edit Imported Data")
                 edited_df = st.data_editor(df_with_status.drop(columns=["Status"], errors="ignore"), num_rows="dynamic")
                 
+                conflict_policy = st.selectbox("When an ID already exists", list(CONFLICT_POLICIES),
+                                               format_func=CONFLICT_POLICIES.get)
+
+                if st.button("Check for duplicates",
+                             help="Look for rows that seem to be an employee already on file under another ID"):
+                    show_duplicate_report(db_manager, edited_df)
+
                 if st.button("Validate and Import"):
                     # Re-validate edited data
                     valid_rows, errors, edited_df_with_status = validate_imported_data(edited_df)
-                    
+
+                    # Import valid rows in a single transaction
+                    report = db_manager.insert_many(valid_rows, on_conflict=conflict_policy)
+                    success_count = len(report["inserted"]) + len(report["replaced"])
+
                     # Display updated status
-                    st.dataframe(edited_df_with_status, use_container_width=True)
-                    
-                    # Import valid rows
-                    success_count = 0
-                    for row in valid_rows:
-                        if db_manager.insert_employee(row):
-                            success_count += 1
-                    
+                    st.dataframe(apply_import_report(edited_df_with_status, report), use_container_width=True)
+
                     if success_count > 0:
                         st.success(f"Successfully imported {success_count} out of {len(edited_df)} records.")
+                    if report["skipped"]:
+                        st.warning(f"Skipped {len(report['skipped'])} records whose ID already exists.")
+                    if report["conflicted"]:
+                        st.error(f"Import cancelled: {len(report['conflicted'])} IDs already exist.")
                     if errors:
                         for error in errors:
                             st.error(error)
-                    if success_count == 0 and not errors:
+                    if success_count == 0 and not errors and not (report["skipped"] or report["conflicted"]):
                         st.warning("No valid records to import.")
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
 
+    with tab5:
+        st.subheader("Workforce Analytics")
+        show_analytics(db_manager)
+
+    if diagnostics_tab:
+        with diagnostics_tab[0]:
+            show_diagnostics(db_manager)
+
+    # Refresh the Prometheus text file for offline scraping
+    metrics_file = os.environ.get("EMS_METRICS_FILE")
+    if metrics_file and isinstance(db_manager.instruments, Metrics):
+        db_manager.instruments.dump(metrics_file, db_manager.diagnostics_gauges())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
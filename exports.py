@@ -0,0 +1,45 @@
+import csv
+import io
+
+# Writers for the export formats that need nothing beyond the standard library and storage; each
+# streams the table to a binary file object. openpyxl is only imported for Excel exports.
+
+def write_csv_export(db_manager, out):
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow(db_manager.get_column_names())
+    for rows in db_manager.iter_employees():
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+def write_excel_export(db_manager, out):
+    from openpyxl import Workbook
+    # Write-only workbooks stream rows to the sheet XML instead of keeping cell objects around
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(db_manager.get_column_names())
+    for rows in db_manager.iter_employees():
+        for row in rows:
+            sheet.append(row)
+    workbook.save(out)
+
+def write_text_export(db_manager, out):
+    # Same layout as DataFrame.to_string(index=False): right-aligned columns sized to the widest value
+    widths = db_manager.get_text_widths()
+    out.write(" ".join(col.rjust(width) for col, width in zip(db_manager.get_column_names(), widths)).encode('utf-8'))
+    for rows in db_manager.iter_employees():
+        lines = ("\n" + " ".join(str(value).rjust(width) for value, width in zip(row, widths)) for row in rows)
+        out.write("".join(lines).encode('utf-8'))
+
+def write_delta_export(db_manager, out, since, upto):
+    # Rows changed in (since, upto], with the change's sequence number and kind; deletes are
+    # tombstones carrying only the id. A trimmed watermark fails before anything is written.
+    changes = db_manager.iter_changes(since, upto)
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow(["change_seq", "change_op", *db_manager.get_column_names()])
+    for rows in changes:
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
@@ -0,0 +1,224 @@
+import codecs
+import queue
+import threading
+from contextlib import contextmanager
+
+# Parsed batches waiting for the writer; bounds memory when parsing outruns the database
+MAX_PENDING_BATCHES = 4
+MAX_REPORTED_ERRORS = 100
+IMPORT_CHUNK_ROWS = 50_000
+SNIFF_BYTES = 64 * 1024
+
+class ImportStopped(Exception):
+    # Raised inside the writer's context when the job ends before the input does, so writers
+    # that only commit a complete import (see DatabaseManager.sync) can roll back
+    def __init__(self, outcome, message=None):
+        super().__init__(message or outcome)
+        self.outcome = outcome
+        self.message = message
+
+class ImportJob:
+    # Runs an import off the UI thread. A reader thread parses and validates batches, a writer
+    # thread applies them, and progress comes back as events that the UI drains with poll().
+    #   read:   iterable of (rows, errors, row_count, fraction_done), consumed on the reader thread
+    #   writer: returns a context manager yielding write(rows, errors), entered on the writer
+    #           thread and called for every batch with rows or validation errors. write returns
+    #           counts for "imported", "skipped" and "failed", plus an optional "stop" message
+    #           that ends the import early. Cancelling or stopping exits the context with
+    #           ImportStopped.
+    def __init__(self, read, writer, max_errors=MAX_REPORTED_ERRORS):
+        self.events = queue.Queue()
+        self.max_errors = max_errors
+        self._read = read
+        self._writer = writer
+        self._batches = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+        self._cancel = threading.Event()
+        self._writer_done = threading.Event()
+        self._threads = [threading.Thread(target=self._read_batches, daemon=True),
+                         threading.Thread(target=self._write_batches, daemon=True)]
+
+        # State as of the last poll(), only touched by the polling thread
+        self.fraction = 0.0
+        self.totals = {"rows": 0, "imported": 0, "skipped": 0, "failed": 0}
+        self.errors = []
+        self.outcome = None  # "completed", "cancelled", "stopped" or "failed"
+        self.message = None
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self):
+        # Block until both threads are done, for callers without a UI loop to poll from
+        for thread in self._threads:
+            thread.join()
+        self.poll()
+        return self
+
+    @property
+    def finished(self):
+        return self.outcome is not None
+
+    def poll(self):
+        # Apply every event queued since the last call and return them
+        events = []
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                return events
+            if kind == "progress":
+                self.fraction, self.totals = payload
+            elif kind == "errors":
+                self.errors.extend(payload)
+            else:
+                self.outcome, self.message = payload
+            events.append((kind, payload))
+
+    def _put(self, batch):
+        # Give up once the writer has stopped, so a full queue can't block the reader forever
+        while not self._writer_done.is_set():
+            try:
+                self._batches.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _read_batches(self):
+        try:
+            for batch in self._read:
+                if self._cancel.is_set() or self._writer_done.is_set():
+                    break
+                self._put(batch)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(None)
+
+    def _write_batches(self):
+        totals = {"rows": 0, "imported": 0, "skipped": 0, "failed": 0}
+        outcome, message = "completed", None
+        reported = 0
+        try:
+            with self._writer() as write:
+                while True:
+                    batch = self._batches.get()
+                    if isinstance(batch, Exception):
+                        raise batch
+                    if self._cancel.is_set():
+                        raise ImportStopped("cancelled")
+                    if batch is None:
+                        break
+                    rows, errors, row_count, fraction = batch
+                    counts = write(rows, errors) if len(rows) or errors else {}
+                    totals["rows"] += row_count
+                    totals["imported"] += counts.get("imported", 0)
+                    totals["skipped"] += counts.get("skipped", 0)
+                    totals["failed"] += len(errors) + counts.get("failed", 0)
+                    if errors and reported < self.max_errors:
+                        self.events.put(("errors", errors[:self.max_errors - reported]))
+                        reported += len(errors[:self.max_errors - reported])
+                    self.events.put(("progress", (fraction, dict(totals))))
+                    if counts.get("stop"):
+                        raise ImportStopped("stopped", counts["stop"])
+        except ImportStopped as e:
+            outcome, message = e.outcome, e.message
+        except Exception as e:
+            outcome, message = "failed", str(e)
+        finally:
+            self._writer_done.set()
+            self.events.put(("finished", (outcome, message)))
+
+# Readers and the insert writer shared by the Streamlit app and the command line. pandas, openpyxl
+# and pyarrow are imported by the readers that need them, so importing this module stays cheap.
+
+def sniff_encoding(file):
+    # Choose between utf-8 and latin1 before any rows are parsed. The whole file is checked, a
+    # block at a time, because a latin1 byte can first turn up long after the start, and a
+    # streaming import can't switch encodings once earlier chunks are written.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    file.seek(0)
+    try:
+        while block := file.read(SNIFF_BYTES):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'latin1'
+    finally:
+        file.seek(0)
+    return 'utf-8'
+
+def sniff_delimiter(file, encoding):
+    file.seek(0)
+    sample = file.read(SNIFF_BYTES).decode(encoding, errors='ignore')
+    file.seek(0)
+    if '\t' in sample:
+        return '\t'
+    elif ',' in sample:
+        return ','
+    return r'\s+'
+
+def read_upload(uploaded_file):
+    # The whole upload as one DataFrame, for previews and the non-streaming import
+    if uploaded_file.name.endswith('.xlsx'):
+        import workbooks
+        return workbooks.read_workbook(uploaded_file)
+    import columnar
+    if columnar.is_columnar(uploaded_file.name):
+        return columnar.read_table(uploaded_file, uploaded_file.name)
+    import pandas as pd
+    encoding = sniff_encoding(uploaded_file)
+    sep = ',' if uploaded_file.name.endswith('.csv') else sniff_delimiter(uploaded_file, encoding)
+    return pd.read_csv(uploaded_file, sep=sep, encoding=encoding)
+
+def iter_upload_chunks(uploaded_file, chunksize=IMPORT_CHUNK_ROWS):
+    # Yields (DataFrame chunk, fraction of the file read so far)
+    if uploaded_file.name.endswith('.xlsx'):
+        import workbooks
+        for result, done in workbooks.iter_sheets(uploaded_file, validate=False, chunksize=chunksize):
+            yield result.frame, done
+        return
+    import columnar
+    if columnar.is_columnar(uploaded_file.name):
+        yield from columnar.read_batches(uploaded_file, uploaded_file.name, chunksize)
+        return
+    import pandas as pd
+    encoding = sniff_encoding(uploaded_file)
+    sep = ',' if uploaded_file.name.endswith('.csv') else sniff_delimiter(uploaded_file, encoding)
+    size = uploaded_file.size if hasattr(uploaded_file, 'size') else None
+    with pd.read_csv(uploaded_file, sep=sep, encoding=encoding, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk, min(uploaded_file.tell() / size, 1.0) if size else 0.0
+
+def read_import_batches(uploaded_file, chunksize=IMPORT_CHUNK_ROWS):
+    if uploaded_file.name.endswith('.xlsx'):
+        import workbooks
+        # Workbooks are parsed and validated a chunk at a time, in parallel across sheets
+        for result, done in workbooks.iter_sheets(uploaded_file, chunksize=chunksize):
+            yield result.rows, result.errors, result.row_count, done
+        return
+    from validation import validate_imported_data
+    # Parse and validate one chunk at a time so memory stays bounded by the chunk size
+    for chunk, done in iter_upload_chunks(uploaded_file, chunksize):
+        valid_rows, errors, _ = validate_imported_data(chunk)
+        if valid_rows is False:
+            yield [], errors, 0, done
+            return
+        yield valid_rows, errors, len(chunk), done
+
+@contextmanager
+def import_writer(db_manager, on_conflict):
+    def write(rows, errors):
+        if not len(rows):
+            return {}
+        report = db_manager.insert_many(rows, on_conflict=on_conflict)
+        return {"imported": len(report["inserted"]) + len(report["replaced"]),
+                "skipped": len(report["skipped"]),
+                "failed": len(report["conflicted"]),
+                "stop": "Import stopped at the first chunk with existing IDs. Earlier chunks were kept."
+                        if report["conflicted"] else None}
+    yield write
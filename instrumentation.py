@@ -0,0 +1,175 @@
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds in seconds, Prometheus style; the last bucket catches everything
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+SLOW_CALL_SECONDS = 0.25
+MAX_SLOW_SAMPLES = 20
+MAX_SAMPLE_STATEMENTS = 10
+
+class Call:
+    # Filled in by the code being measured
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.statements = None
+        self.seconds = 0.0
+
+class Recorder:
+    # The instrumentation surface. This base records nothing; pass a subclass to
+    # DatabaseManager or to set_recorder() to send measurements somewhere else.
+    slow_seconds = SLOW_CALL_SECONDS
+
+    @contextmanager
+    def call(self, name, explain=None):
+        yield Call(name)
+
+    def increment(self, name, amount=1):
+        pass
+
+class Metrics(Recorder):
+    # In-memory latency histograms, row counts, counters and slow call samples
+    def __init__(self, slow_seconds=SLOW_CALL_SECONDS, max_samples=MAX_SLOW_SAMPLES):
+        self.slow_seconds = slow_seconds
+        self._calls = {}
+        self._counters = {}
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def call(self, name, explain=None):
+        # explain(sql) returns the query plan of a captured statement, for slow call samples
+        call = Call(name)
+        start = time.perf_counter()
+        try:
+            yield call
+        finally:
+            call.seconds = time.perf_counter() - start
+            self._observe(call, explain)
+
+    def _observe(self, call, explain):
+        sample = None
+        # Only calls that captured their SQL are sampled; the plan is what makes a sample useful
+        if call.statements is not None and call.seconds >= self.slow_seconds:
+            # Statements run inside triggers and virtual tables come through prefixed with "--"
+            statements = [sql for sql in call.statements if not sql.startswith("--")][:MAX_SAMPLE_STATEMENTS]
+            sample = {"call": call.name, "seconds": call.seconds, "rows": call.rows, "at": time.time(),
+                      "statements": [{"sql": sql, "plan": self._plan(explain, sql)} for sql in statements]}
+        with self._lock:
+            stats = self._calls.get(call.name)
+            if stats is None:
+                stats = self._calls[call.name] = {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0,
+                                                  "sum": 0.0, "max": 0.0, "rows": 0}
+            stats["buckets"][next(i for i, bound in enumerate(LATENCY_BUCKETS) if call.seconds <= bound)] += 1
+            stats["count"] += 1
+            stats["sum"] += call.seconds
+            stats["max"] = max(stats["max"], call.seconds)
+            stats["rows"] += call.rows or 0
+            if sample:
+                self._samples.append(sample)
+
+    def _plan(self, explain, sql):
+        if explain is None or not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+        try:
+            return explain(sql)
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._counters.clear()
+            self._samples.clear()
+
+    def snapshot(self):
+        with self._lock:
+            calls = {name: dict(stats, buckets=list(stats["buckets"])) for name, stats in self._calls.items()}
+            return {"calls": calls, "counters": dict(self._counters), "slow_calls": list(self._samples)}
+
+    def summary(self):
+        # One row per call: count, mean, approximate p50/p95 (bucket upper bounds) and max
+        rows = []
+        for name, stats in sorted(self.snapshot()["calls"].items()):
+            rows.append({"call": name, "count": stats["count"], "rows": stats["rows"],
+                         "mean_ms": 1000 * stats["sum"] / stats["count"],
+                         "p50_ms": 1000 * min(quantile_bound(stats, 0.5), stats["max"]),
+                         "p95_ms": 1000 * min(quantile_bound(stats, 0.95), stats["max"]),
+                         "max_ms": 1000 * stats["max"]})
+        return rows
+
+    def to_prometheus(self, gauges=None, prefix="ems"):
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_call_duration_seconds Latency of instrumented calls.",
+                 f"# TYPE {prefix}_call_duration_seconds histogram"]
+        for name, stats in sorted(snapshot["calls"].items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'{prefix}_call_duration_seconds_bucket{{call="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_call_duration_seconds_sum{{call="{name}"}} {stats["sum"]!r}')
+            lines.append(f'{prefix}_call_duration_seconds_count{{call="{name}"}} {stats["count"]}')
+        lines += [f"# HELP {prefix}_call_rows_total Rows returned or written by instrumented calls.",
+                  f"# TYPE {prefix}_call_rows_total counter"]
+        lines += [f'{prefix}_call_rows_total{{call="{name}"}} {stats["rows"]}'
+                  for name, stats in sorted(snapshot["calls"].items())]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        for name, value in sorted((gauges or {}).items()):
+            lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, gauges=None):
+        # Write to a temporary file and rename it, so a scraper never reads half a file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus(gauges))
+        os.replace(tmp_path, path)
+
+def quantile_bound(stats, q):
+    # Upper bound of the bucket holding the q-th quantile
+    target = q * stats["count"]
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+        seen += count
+        if seen >= target:
+            return bound
+    return math.inf
+
+# Process-wide recorder, used by module-level functions and by default for every DatabaseManager
+_recorder = Metrics()
+
+def get_recorder():
+    return _recorder
+
+def set_recorder(recorder):
+    global _recorder
+    _recorder = recorder
+
+@contextmanager
+def timed(name):
+    with _recorder.call(name) as call:
+        yield call
+
+def measured(name=None, rows=None):
+    # Decorator for module-level functions; rows(result) gives the row count to record
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _recorder.call(name or function.__name__) as call:
+                result = function(*args, **kwargs)
+                if rows:
+                    call.rows = rows(result)
+            return result
+        return wrapper
+    return decorate
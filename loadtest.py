@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from storage import DatabaseManager
+
+# Load test for api.py: keep-alive connections issue a mix of requests for a fixed time, then
+# requests/sec and latency percentiles are reported per request kind and overall. With --spawn a
+# server is started on a temporary database seeded with --rows employees.
+#   python loadtest.py --spawn --rows 100k --connections 32 --duration 10
+#   python loadtest.py --url http://127.0.0.1:8080 --mix get=1
+
+ROLES = ["Engineer", "Manager", "Analyst", "Designer", "Support", "Sales"]
+DEFAULT_MIX = "get=50,search=15,page=15,count=5,insert=10,update=5"
+
+def seed(db_name, rows):
+    db = DatabaseManager(db_name)
+    batch = 50_000
+    for start in range(0, rows, batch):
+        db.insert_many([(f"E{i:07d}", f"Person {i}", 18 + i % 60, ROLES[i % len(ROLES)])
+                        for i in range(start, min(start + batch, rows))])
+    db.close()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Client:
+    # One keep-alive connection
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin1").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        headers = {name.lower(): value.strip() for name, _, value in (line.partition(":") for line in lines[1:] if line)}
+        await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            self.writer.close()
+            self.writer = None
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def make_request(kind, rng, rows, counter):
+    # -> (method, path, payload)
+    employee_id = f"E{rng.randrange(rows):07d}" if rows else "E0000000"
+    if kind == "get":
+        return "GET", f"/employees/{employee_id}", None
+    if kind == "search":
+        return "GET", f"/search?q=Person+{rng.randrange(1000)}&limit=20", None
+    if kind == "page":
+        return "GET", f"/employees?page_size=50&order_by=name&role={rng.choice(ROLES)}", None
+    if kind == "count":
+        return "GET", f"/count?role={rng.choice(ROLES)}&min_age={rng.randrange(18, 60)}", None
+    if kind == "insert":
+        counter[0] += 1
+        return "POST", "/employees", {"id": f"L{os.getpid()}{counter[0]:08d}", "name": "Load Test",
+                                      "age": 30, "role": rng.choice(ROLES)}
+    if kind == "update":
+        return "PUT", f"/employees/{employee_id}", {"name": f"Person {rng.randrange(10**6)}",
+                                                     "age": rng.randrange(18, 80), "role": rng.choice(ROLES)}
+    raise ValueError(f"Unknown request kind '{kind}'")
+
+async def worker(client, kinds, weights, deadline, rows, seed, results, counter):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        method, path, payload = make_request(kind, rng, rows, counter)
+        start = time.perf_counter()
+        try:
+            status = await client.request(method, path, payload)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            client.writer = None
+            status = 0
+        results.append((kind, time.perf_counter() - start, status))
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def report(results, seconds):
+    by_kind = {}
+    for kind, latency, status in results:
+        by_kind.setdefault(kind, []).append((latency, status))
+    print(f"{'kind':<8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for kind, samples in sorted(by_kind.items()) + [("total", [(latency, status) for _, latency, status in results])]:
+        latencies = sorted(latency for latency, _ in samples)
+        # 404s from ids that don't exist and 409s are answers, not failures
+        errors = sum(1 for _, status in samples if status == 0 or status >= 500)
+        print(f"{kind:<8} {len(samples):>9,} {len(samples) / seconds:>9,.0f} {percentile(latencies, 0.5) * 1000:>8.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.2f} {errors:>7,}")
+    return sum(1 for _, _, status in results if status == 0 or status >= 500)
+
+async def run_load(host, port, connections, duration, mix, rows):
+    kinds, weights = [], []
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        kinds.append(kind.strip())
+        weights.append(float(weight or 1))
+    for kind in kinds:
+        make_request(kind, random.Random(), rows, [0])
+    clients = [Client(host, port) for _ in range(connections)]
+    results, counter = [], [0]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker(client, kinds, weights, start + duration, rows, i, results, counter)
+                               for i, client in enumerate(clients)))
+    finally:
+        for client in clients:
+            client.close()
+    return results, time.perf_counter() - start
+
+async def wait_until_up(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            client = Client(host, port)
+            if await client.request("GET", "/health") == 200:
+                client.close()
+                return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+def parse_count(text):
+    text = text.lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the employee JSON API.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="server to test (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="start api.py on a temporary seeded database")
+    parser.add_argument("--rows", default="10k", help="employees to seed with --spawn, or known to exist otherwise")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted request kinds (default: {DEFAULT_MIX})")
+    args = parser.parse_args(argv)
+    rows = parse_count(args.rows)
+
+    server = workdir = None
+    if args.spawn:
+        workdir = tempfile.TemporaryDirectory(prefix="ems-load-")
+        db_name = os.path.join(workdir.name, "load.db")
+        print(f"Seeding {rows:,} employees...", flush=True)
+        seed(db_name, rows)
+        host, port = "127.0.0.1", free_port()
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api.py"),
+                                   "--db", db_name, "--port", str(port)])
+    else:
+        host, _, port = args.url.split("://", 1)[-1].rstrip("/").partition(":")
+        port = int(port or 80)
+    try:
+        asyncio.run(wait_until_up(host, port))
+        print(f"{args.connections} connections for {args.duration:g}s against http://{host}:{port}", flush=True)
+        results, seconds = asyncio.run(run_load(host, port, args.connections, args.duration, args.mix, rows))
+        errors = report(results, seconds)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if workdir is not None:
+            workdir.cleanup()
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
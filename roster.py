@@ -0,0 +1,131 @@
+import sys
+from array import array
+import numpy as np
+import pandas as pd
+from storage import EMPLOYEE_COLUMNS
+
+NO_AGE = -(2 ** 63)  # Stands in for a missing age in the integer column
+NO_ROLE = -1  # Role code of a missing role, the same as pandas' code for a missing category
+
+class Roster:
+    # Employees held column-wise: ages as machine integers, roles as small codes into one table of
+    # interned strings, and a dict from id to position for O(1) lookups. Removed rows leave a hole
+    # until holes outnumber rows, so removal stays O(1) and row order is kept.
+    __slots__ = ("columns", "ids", "names", "ages", "role_codes", "roles", "extra",
+                 "_role_codes", "_positions", "_holes")
+
+    def __init__(self, rows=(), columns=EMPLOYEE_COLUMNS):
+        self.columns = list(columns)
+        self.ids = []
+        self.names = []
+        self.ages = array("q")
+        self.role_codes = array("i")
+        self.roles = []
+        self.extra = [[] for _ in self.columns[len(EMPLOYEE_COLUMNS):]]
+        self._role_codes = {}
+        self._positions = {}
+        self._holes = 0
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, employee_id):
+        return employee_id in self._positions
+
+    def __iter__(self):
+        return (self._row(position) for position in range(len(self.ids)) if self.ids[position] is not None)
+
+    def _role_code(self, role):
+        if role is None:
+            return NO_ROLE
+        code = self._role_codes.get(role)
+        if code is None:
+            role = sys.intern(role) if isinstance(role, str) else role
+            code = self._role_codes[role] = len(self.roles)
+            self.roles.append(role)
+        return code
+
+    def _row(self, position):
+        age = self.ages[position]
+        code = self.role_codes[position]
+        return (self.ids[position], self.names[position], None if age == NO_AGE else age,
+                None if code == NO_ROLE else self.roles[code], *(column[position] for column in self.extra))
+
+    def _set(self, position, row):
+        age = row[2]
+        if isinstance(self.ages, array) and age is not None and type(age) is not int:
+            # Legacy text ages don't fit the integer column; from now on this roster keeps them as objects
+            self.ages = [None if value == NO_AGE else value for value in self.ages]
+        if isinstance(self.ages, array) and age is None:
+            age = NO_AGE
+        self.ages[position] = age
+        self.names[position] = row[1]
+        self.role_codes[position] = self._role_code(row[3])
+        for column, value in zip(self.extra, row[4:]):
+            column[position] = value
+
+    def add(self, row):
+        # Insert or replace by id
+        position = self._positions.get(row[0])
+        if position is None:
+            position = self._positions[row[0]] = len(self.ids)
+            self.ids.append(row[0])
+            self.names.append(None)
+            self.ages.append(NO_AGE if isinstance(self.ages, array) else None)
+            self.role_codes.append(NO_ROLE)
+            for column in self.extra:
+                column.append(None)
+        self._set(position, row)
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def get(self, employee_id):
+        position = self._positions.get(employee_id)
+        return None if position is None else self._row(position)
+
+    def remove(self, employee_id):
+        position = self._positions.pop(employee_id, None)
+        if position is None:
+            return False
+        self.ids[position] = self.names[position] = None
+        self._holes += 1
+        if self._holes > len(self._positions):
+            self._compact()
+        return True
+
+    def clear(self):
+        self.__init__(columns=self.columns)
+
+    def _compact(self):
+        keep = [position for position in range(len(self.ids)) if self.ids[position] is not None]
+        self.ids = [self.ids[position] for position in keep]
+        self.names = [self.names[position] for position in keep]
+        ages = [self.ages[position] for position in keep]
+        self.ages = array("q", ages) if isinstance(self.ages, array) else ages
+        self.role_codes = array("i", (self.role_codes[position] for position in keep))
+        self.extra = [[column[position] for position in keep] for column in self.extra]
+        self._positions = {employee_id: position for position, employee_id in enumerate(self.ids)}
+        self._holes = 0
+
+    def to_frame(self):
+        # Ages become a nullable integer column and roles a categorical over the interned table,
+        # so the frame is about as compact as the roster
+        if self._holes:
+            self._compact()
+        if isinstance(self.ages, array):
+            values = np.frombuffer(self.ages, dtype=np.int64)
+            ages = pd.arrays.IntegerArray(values.copy(), values == NO_AGE)
+        else:
+            ages = pd.Series(self.ages, dtype=object)
+        roles = pd.Categorical.from_codes(np.frombuffer(self.role_codes, dtype=np.int32), self.roles)
+        objects = [pd.Series(column, dtype=object) for column in (self.ids, self.names, *self.extra)]
+        data = dict(zip(self.columns, [objects[0], objects[1], ages, roles, *objects[2:]]))
+        return pd.DataFrame(data, columns=self.columns)
+
+    def tree_values(self, employee_id):
+        # A Treeview row: the four displayed columns, with blanks for missing values
+        row = self.get(employee_id)
+        return None if row is None else tuple("" if value is None else value for value in row[:4])
@@ -0,0 +1,1065 @@
+import functools
+import hashlib
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from instrumentation import get_recorder
+
+# Conflict policies for bulk imports when an ID already exists
+CONFLICT_POLICIES = {
+    "skip": "Skip existing IDs",
+    "replace": "Replace existing records",
+    "fail": "Cancel the import",
+}
+
+# The typed columns every front end shares, in table order
+EMPLOYEE_COLUMNS = ["id", "name", "age", "role"]
+EMPLOYEE_SCHEMA = "id TEXT PRIMARY KEY, name TEXT, age INTEGER, role TEXT"
+
+def retype_legacy_table(conn):
+    # The Tkinter and simple Streamlit apps used to create (id INTEGER PRIMARY KEY, age TEXT).
+    # Rebuild such a table with the typed schema, keeping any extra imported columns.
+    columns = {info[1]: (info[2] or "TEXT").upper() for info in conn.execute("PRAGMA table_info(employees)")}
+    if columns.get("id") == "TEXT" and columns.get("age") == "INTEGER":
+        return
+    extra = [column for column in columns if column not in EMPLOYEE_COLUMNS]
+    definitions = ", ".join([EMPLOYEE_SCHEMA] + [f'"{column}" {columns[column]}' for column in extra])
+    column_list = ", ".join(f'"{column}"' for column in EMPLOYEE_COLUMNS + extra)
+    conn.execute(f"CREATE TABLE employees_typed ({definitions})")
+    # Column affinity converts on the way in: integer ids become text, numeric age strings integers
+    conn.execute(f"INSERT INTO employees_typed ({column_list}) SELECT {column_list} FROM employees")
+    # The search index points at the old table's rowids; it is recreated and rebuilt after migrating
+    conn.execute("DROP TABLE IF EXISTS employees_fts")
+    conn.execute("DROP TABLE employees")
+    conn.execute("ALTER TABLE employees_typed RENAME TO employees")
+
+def age_band(age):
+    # SQL for the decade an age falls in (30 for 30-39); -1 for missing or non-numeric ages
+    return f"CASE WHEN typeof({age}) = 'integer' THEN {age} / 10 * 10 ELSE -1 END"
+
+# Headcount per (role, age band), kept current by triggers so dashboards read
+# O(#roles x #bands) rows instead of scanning employees
+ANALYTICS_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS employee_stats (
+           role TEXT NOT NULL, age_band INTEGER NOT NULL, headcount INTEGER NOT NULL,
+           PRIMARY KEY (role, age_band)) WITHOUT ROWID''',
+    f'''CREATE TRIGGER IF NOT EXISTS employee_stats_insert AFTER INSERT ON employees BEGIN
+            INSERT INTO employee_stats (role, age_band, headcount)
+            VALUES (COALESCE(new.role, ''), {age_band("new.age")}, 1)
+            ON CONFLICT (role, age_band) DO UPDATE SET headcount = headcount + 1;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS employee_stats_delete AFTER DELETE ON employees BEGIN
+            UPDATE employee_stats SET headcount = headcount - 1
+            WHERE role = COALESCE(old.role, '') AND age_band = {age_band("old.age")};
+            DELETE FROM employee_stats WHERE headcount <= 0;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS employee_stats_update AFTER UPDATE OF role, age ON employees
+        WHEN old.role IS NOT new.role OR old.age IS NOT new.age BEGIN
+            UPDATE employee_stats SET headcount = headcount - 1
+            WHERE role = COALESCE(old.role, '') AND age_band = {age_band("old.age")};
+            INSERT INTO employee_stats (role, age_band, headcount)
+            VALUES (COALESCE(new.role, ''), {age_band("new.age")}, 1)
+            ON CONFLICT (role, age_band) DO UPDATE SET headcount = headcount + 1;
+            DELETE FROM employee_stats WHERE headcount <= 0;
+        END''',
+]
+
+# Adds (or with a negative sign, removes) the rows matched by {where} to the summary
+ANALYTICS_DELTA = f'''INSERT INTO employee_stats (role, age_band, headcount)
+                      SELECT COALESCE(role, ''), {age_band("age")}, {{sign}}COUNT(*) FROM employees
+                      WHERE {{where}} GROUP BY 1, 2
+                      ON CONFLICT (role, age_band) DO UPDATE SET headcount = headcount + excluded.headcount'''
+
+# Persistent counter bumped by every change to employees. Unlike PRAGMA data_version it
+# survives restarts, so files derived from the table (snapshots) can tell if they are current.
+GENERATION_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS storage_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID",
+    "INSERT OR IGNORE INTO storage_meta (key, value) VALUES ('generation', 0)",
+    *(f'''CREATE TRIGGER IF NOT EXISTS employees_generation_{event.lower()} AFTER {event} ON employees BEGIN
+              UPDATE storage_meta SET value = value + 1 WHERE key = 'generation';
+          END''' for event in ("INSERT", "UPDATE", "DELETE")),
+]
+BUMP_GENERATION = "UPDATE storage_meta SET value = value + 1 WHERE key = 'generation'"
+
+# One entry per insert, update and delete, numbered by a sequence that never goes backwards
+# (AUTOINCREMENT never reuses a seq, even after trimming), for incremental exports
+CHANGE_LOG_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS employee_changes (
+           seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, op TEXT NOT NULL,
+           changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TRIGGER IF NOT EXISTS employee_changes_insert AFTER INSERT ON employees BEGIN
+           INSERT INTO employee_changes (id, op) VALUES (new.id, 'insert');
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employee_changes_update AFTER UPDATE ON employees BEGIN
+           INSERT INTO employee_changes (id, op) SELECT old.id, 'delete' WHERE old.id IS NOT new.id;
+           INSERT INTO employee_changes (id, op)
+           VALUES (new.id, CASE WHEN old.id IS new.id THEN 'update' ELSE 'insert' END);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employee_changes_delete AFTER DELETE ON employees BEGIN
+           INSERT INTO employee_changes (id, op) VALUES (old.id, 'delete');
+       END''',
+    # Oldest watermark a delta can still start from; trim_changes moves it forward
+    "INSERT OR IGNORE INTO storage_meta (key, value) VALUES ('changes_trimmed_to', 0)",
+]
+
+# Latest sequence number; the trim point stands in for it once every entry has been trimmed
+CHANGE_WATERMARK = '''SELECT MAX(COALESCE((SELECT MAX(seq) FROM employee_changes), 0),
+                             (SELECT value FROM storage_meta WHERE key = 'changes_trimmed_to'))'''
+
+# Content hash of each row as last written by a sync. Any other write to a row drops its hash,
+# so a stored hash always describes the stored row.
+ROW_HASH_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS employee_hashes (id TEXT PRIMARY KEY, hash BLOB NOT NULL) WITHOUT ROWID",
+    '''CREATE TRIGGER IF NOT EXISTS employee_hashes_update AFTER UPDATE ON employees BEGIN
+           DELETE FROM employee_hashes WHERE id IN (old.id, new.id);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employee_hashes_delete AFTER DELETE ON employees BEGIN
+           DELETE FROM employee_hashes WHERE id = old.id;
+       END''',
+]
+
+def row_hash(columns, row):
+    return hashlib.blake2b(repr((columns, row)).encode(), digest_size=16).digest()
+
+def new_columns(existing, columns):
+    # Columns not already present, compared case-insensitively like SQLite does
+    seen = {column.lower() for column in existing}
+    new = []
+    for column in columns:
+        if column.lower() not in seen:
+            seen.add(column.lower())
+            new.append(column)
+    return new
+
+# Applied in order and tracked with PRAGMA user_version, so they only ever run once per database.
+# Entries are SQL statements or functions taking the connection.
+MIGRATIONS = [
+    f"CREATE TABLE IF NOT EXISTS employees ({EMPLOYEE_SCHEMA})",
+    # Seek index for paging by name; id breaks ties so the cursor is unique
+    "CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (name, id)",
+    retype_legacy_table,
+    # Recreated in case the table was just rebuilt
+    "CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (name, id)",
+    # Role equality and age ranges, with id as the tiebreaker for keyset paging
+    "CREATE INDEX IF NOT EXISTS idx_employees_role ON employees (role, id)",
+    "CREATE INDEX IF NOT EXISTS idx_employees_age ON employees (age, id)",
+    *ANALYTICS_SCHEMA,
+    ANALYTICS_DELTA.format(sign="", where="true"),
+    *GENERATION_SCHEMA,
+    *CHANGE_LOG_SCHEMA,
+    # Rows that predate the log count as inserted, so a delta from 0 is a full copy
+    "INSERT INTO employee_changes (id, op) SELECT id, 'insert' FROM employees ORDER BY rowid",
+    *ROW_HASH_SCHEMA,
+]
+
+# Structured filters for listing and counting. Unset fields are ignored, set ones are ANDed,
+# and each can be answered from its own index. name_prefix is case-sensitive.
+EmployeeFilter = namedtuple("EmployeeFilter", ["role", "min_age", "max_age", "name_prefix"],
+                            defaults=(None, None, None, None))
+
+def filter_conditions(filters):
+    conditions, params = [], []
+    if filters is None:
+        return conditions, params
+    if filters.role is not None:
+        conditions.append("role = ?")
+        params.append(filters.role)
+    if filters.min_age is not None or filters.max_age is not None:
+        # Text ages that never converted sort above every integer, so keep them out of ranges
+        conditions.append("typeof(age) = 'integer'")
+    if filters.min_age is not None:
+        conditions.append("age >= ?")
+        params.append(filters.min_age)
+    if filters.max_age is not None:
+        conditions.append("age <= ?")
+        params.append(filters.max_age)
+    if filters.name_prefix:
+        # A range instead of LIKE, so the (name, id) index can seek to it
+        prefix = filters.name_prefix
+        conditions.append("name >= ? AND name < ?")
+        params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    return conditions, params
+
+# Columns update_where can set
+BULK_UPDATE_COLUMNS = ["name", "age", "role"]
+
+# Columns the listing can be ordered by; the page cursor is (sort value, id) of the last row
+PAGE_SORT_KEYS = ["id", "name", "age", "role"]
+
+# Trigram full-text index over id, name and role, kept in sync by triggers.
+# Only created when SQLite is compiled with FTS5; search falls back to LIKE otherwise.
+SEARCH_INDEX_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5(
+           id, name, role, content='employees', content_rowid='rowid', tokenize='trigram')''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_fts_insert AFTER INSERT ON employees BEGIN
+           INSERT INTO employees_fts(rowid, id, name, role) VALUES (new.rowid, new.id, new.name, new.role);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_fts_delete AFTER DELETE ON employees BEGIN
+           INSERT INTO employees_fts(employees_fts, rowid, id, name, role)
+           VALUES ('delete', old.rowid, old.id, old.name, old.role);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_fts_update AFTER UPDATE ON employees BEGIN
+           INSERT INTO employees_fts(employees_fts, rowid, id, name, role)
+           VALUES ('delete', old.rowid, old.id, old.name, old.role);
+           INSERT INTO employees_fts(rowid, id, name, role) VALUES (new.rowid, new.id, new.name, new.role);
+       END''',
+]
+
+# Trigrams need at least three characters; shorter queries use LIKE
+MIN_INDEXED_QUERY = 3
+
+# Batches at least this large skip the per-row insert and update triggers (search index
+# and analytics) and apply their effects set-wise instead
+BULK_INDEX_THRESHOLD = 1000
+
+# Applied to every pooled connection
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous=NORMAL",  # Safe with WAL and avoids an fsync per commit
+    "PRAGMA cache_size=-16000",  # 16 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=134217728",
+]
+
+# Writes queued within this long of the first one share its commit. The writer only waits
+# while writes are arriving concurrently, so a lone session doesn't pay for the window.
+GROUP_COMMIT_WINDOW = 0.002
+MAX_GROUP_SIZE = 256
+
+# Limits for the per-process query result cache
+RESULT_CACHE_ENTRIES = 256
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+class ConnectionPool:
+    def __init__(self, db_name, size=8, timeout=30):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        # Per-thread list that collects the SQL run on this pool while a call is being instrumented
+        self.statements = threading.local()
+
+    def _connect(self):
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if not can_create:
+            return self._idle.get(timeout=self.timeout)
+        try:
+            return self._connect()
+        except sqlite3.Error:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        sink = getattr(self.statements, "sink", None)
+        if sink is not None:
+            conn.set_trace_callback(sink.append)
+        try:
+            yield conn
+        finally:
+            if sink is not None:
+                conn.set_trace_callback(None)
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+class WriteQueue:
+    # Owns the one write connection of a DatabaseManager, on its own thread. Submitted operations
+    # (functions of the connection) are grouped into one transaction each, every operation in its
+    # own savepoint so a failing one doesn't undo the rest, and their futures resolve once the
+    # group has committed. Whole transactions borrow the connection with exclusive().
+    _STOP = object()
+
+    def __init__(self, connect, on_commit=None, window=GROUP_COMMIT_WINDOW, max_group=MAX_GROUP_SIZE):
+        self.window = window
+        self.max_group = max_group
+        self._on_commit = on_commit
+        self._conn = connect()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args):
+        future = Future()
+        self._queue.put((future, operation, args))
+        return future
+
+    @contextmanager
+    def exclusive(self):
+        # Wait for the writer to finish the group in hand, then have the connection to ourselves
+        granted, released = threading.Event(), threading.Event()
+        self._queue.put((granted, released))
+        granted.wait()
+        try:
+            yield self._conn
+        finally:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            released.set()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._conn.close()
+
+    def _run(self):
+        concurrent = False
+        item = self._queue.get()
+        while item is not self._STOP:
+            if len(item) == 2:
+                granted, released = item
+                granted.set()
+                released.wait()
+                item = self._queue.get()
+                continue
+            # Gather what arrives within the window; a lease or stop ends the group early
+            group = [item]
+            deadline = time.monotonic() + (self.window if concurrent else 0)
+            item = None
+            while len(group) < self.max_group:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    item = None
+                    break
+                if item is self._STOP or len(item) == 2:
+                    break
+                group.append(item)
+                item = None
+            self._commit(group)
+            concurrent = len(group) > 1
+            if item is None:
+                item = self._queue.get()
+
+    def _commit(self, group):
+        conn = self._conn
+        group = [(future, operation, args) for future, operation, args in group if future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, operation, args in group:
+                conn.execute("SAVEPOINT queued_write")
+                try:
+                    outcomes.append((future, operation(conn, *args), None))
+                    conn.execute("RELEASE queued_write")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO queued_write")
+                    conn.execute("RELEASE queued_write")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # The group as a whole failed (e.g. the database stayed locked by another process)
+            if conn.in_transaction:
+                conn.rollback()
+            for future, _, _ in group:
+                future.set_exception(e)
+            return
+        if self._on_commit:
+            self._on_commit(len(group))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+def estimate_size(result):
+    # Rough footprint of a query result. Large row lists are sampled rather than walked.
+    if isinstance(result, list) and len(result) > 100:
+        return sys.getsizeof(result) + len(result) * estimate_size(result[:100]) // 100
+    if isinstance(result, (list, tuple)):
+        return sys.getsizeof(result) + sum(estimate_size(item) for item in result)
+    return sys.getsizeof(result)
+
+class ResultCache:
+    # LRU cache of query results, emptied as soon as the database's data version moves
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, version, load):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        # Load outside the lock; the version was read first, so the result is never older than it
+        result = load()
+        size = estimate_size(result)
+        with self._lock:
+            if version == self._version and size <= self.max_bytes:
+                if key in self._entries:
+                    self._bytes -= self._entries.pop(key)[1]
+                self._entries[key] = (result, size)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._bytes -= self._entries.popitem(last=False)[1][1]
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+def instrumented(rows=None, capture=True):
+    # Time a DatabaseManager method. Reads also capture their SQL so slow calls can be
+    # sampled with a query plan; bulk writes don't, one trace per executemany row is too much.
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instruments.call(method.__name__, explain=self.explain) as call:
+                previous = getattr(self.pool.statements, "sink", None)
+                if capture:
+                    call.statements = self.pool.statements.sink = []
+                try:
+                    result = method(self, *args, **kwargs)
+                finally:
+                    self.pool.statements.sink = previous
+                if rows:
+                    call.rows = rows(result)
+            return result
+        return wrapper
+    return decorate
+
+def cached_query(method):
+    # Serve repeated reads from the manager's result cache until the next committed write
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        return self.cache.get(key, self.data_version(), lambda: method(self, *args, **kwargs))
+    return wrapper
+
+# Single-row writes, run by the writer thread inside a group commit
+def insert_row(conn, details):
+    try:
+        conn.execute("INSERT INTO employees (id, name, age, role) VALUES (?, ?, ?, ?)", details)
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+def update_row(conn, id, details):
+    return conn.execute("UPDATE employees SET name=?, age=?, role=? WHERE id=?",
+                        (details[1], details[2], details[3], id)).rowcount > 0
+
+def delete_row(conn, employee_id):
+    return conn.execute("DELETE FROM employees WHERE id=?", (employee_id,)).rowcount > 0
+
+WRITE_OPERATIONS = {"insert": insert_row, "update": update_row, "delete": delete_row}
+
+class SyncSession:
+    # One sync's view of the table: the content hash of every stored row, read once up front, so
+    # each imported row is classified with a dict lookup. Rows without a hash (added or edited
+    # outside a sync) are written once and hashed from then on.
+    def __init__(self, manager, conn):
+        self.manager = manager
+        self.conn = conn
+        self.hashes = dict(conn.execute('''SELECT e.id, h.hash FROM employees e
+                                           LEFT JOIN employee_hashes h ON h.id = e.id'''))
+        self.seen = set()
+        self.prune = True
+        self.report = {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0, "removed": 0, "kept": 0}
+
+    def apply(self, rows, columns=EMPLOYEE_COLUMNS):
+        # Writes the rows whose content differs from what is stored and returns this batch's counts.
+        # Rows are laid out like the table, so columns an import leaves out are cleared; an id seen
+        # earlier in the sync keeps its first row.
+        self.manager._add_columns(self.conn, columns)
+        table_columns = tuple(self.manager._columns(self.conn))
+        positions = {column.lower(): i for i, column in reversed(list(enumerate(columns)))}
+        order = [positions.get(column.lower()) for column in table_columns]
+        counts = dict.fromkeys(self.report, 0)
+        to_write, hashes, updated = [], [], []
+        for row in rows:
+            row = tuple(None if i is None else row[i] for i in order)
+            employee_id = row[0] if isinstance(row[0], str) or row[0] is None else str(row[0])
+            if employee_id in self.seen:
+                counts["duplicates"] += 1
+                continue
+            self.seen.add(employee_id)
+            row = (employee_id,) + row[1:]
+            digest = row_hash(table_columns, row)
+            stored = self.hashes.get(employee_id, False)
+            if stored == digest:
+                counts["unchanged"] += 1
+                continue
+            if stored is False:
+                counts["inserted"] += 1
+            else:
+                counts["updated"] += 1
+                updated.append(employee_id)
+            self.hashes[employee_id] = digest
+            to_write.append(row)
+            hashes.append((employee_id, digest))
+        if to_write:
+            column_list = ", ".join(f'"{column}"' for column in table_columns)
+            updates = ", ".join(f'"{column}"=excluded."{column}"' for column in table_columns[1:])
+            sql = (f"INSERT INTO employees ({column_list}) VALUES ({', '.join('?' * len(table_columns))}) "
+                   f"ON CONFLICT(id) DO UPDATE SET {updates}")
+            with self.manager._bulk_load(self.conn, len(to_write), updated):
+                self.conn.executemany(sql, to_write)
+            self.conn.executemany("INSERT OR REPLACE INTO employee_hashes (id, hash) VALUES (?, ?)", hashes)
+        for key, count in counts.items():
+            self.report[key] += count
+        return counts
+
+    def keep_missing(self):
+        # Called when part of the import was rejected (rows that failed validation, a sheet without
+        # the required columns): those rows may belong to stored employees, so none are removed
+        self.prune = False
+
+    def finish(self):
+        # Remove employees the import didn't contain. An import with no valid rows at all removes
+        # nothing rather than emptying the table, and neither does one with rejected rows; the
+        # employees that would have gone are counted as kept.
+        if self.seen:
+            gone = [employee_id for employee_id in self.hashes if employee_id not in self.seen]
+            if gone and self.prune:
+                self.report["removed"] = self.manager._delete_ids(self.conn, gone)
+            elif gone:
+                self.report["kept"] = len(gone)
+        return self.report
+
+class DatabaseManager:
+    def __init__(self, db_name='employee.db', pool_size=8, instruments=None):
+        self.db_name = db_name
+        self._instruments = instruments
+        self.pool = ConnectionPool(db_name, size=pool_size)
+        # Every write in this process goes through here, so sessions queue instead of fighting
+        # over the database lock
+        self.writes = WriteQueue(self.pool._connect, on_commit=self._count_commit)
+        self.migrate()
+        # Never writes, so its PRAGMA data_version moves on every commit by any other connection
+        self._version_conn = sqlite3.connect(db_name, check_same_thread=False)
+        self._version_lock = threading.Lock()
+        self.cache = ResultCache()
+        self._schema = None
+
+    @property
+    def instruments(self):
+        # Falls back to the process-wide recorder, so set_recorder() reaches existing managers too
+        return self._instruments or get_recorder()
+
+    def explain(self, sql):
+        with self.pool.connection() as conn:
+            return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+    def diagnostics_gauges(self):
+        gauges = {f"result_cache_{name}": value for name, value in self.cache.stats().items()}
+        gauges["pool_connections"] = self.pool._created
+        gauges["write_queue_depth"] = self.writes.depth()
+        return gauges
+
+    def submit(self, operation, *args):
+        # Queue one of WRITE_OPERATIONS without waiting; the future resolves to what the blocking
+        # method would return once the write has committed
+        if operation not in WRITE_OPERATIONS:
+            raise ValueError(f"Unknown write '{operation}'. Expected one of: {', '.join(WRITE_OPERATIONS)}")
+        return self.writes.submit(WRITE_OPERATIONS[operation], *args)
+
+    def _count_commit(self, writes):
+        self.instruments.increment("commits")
+        self.instruments.increment("queued_writes", writes)
+
+    def generation(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT value FROM storage_meta WHERE key = 'generation'").fetchone()[0]
+
+    def data_version(self):
+        # Changes after every committed write, from this process or any other
+        with self._version_lock:
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def migrate(self):
+        with self.pool.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+        with self.transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for statement in MIGRATIONS[version:]:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            if version < len(MIGRATIONS):
+                conn.execute(f"PRAGMA user_version={len(MIGRATIONS)}")
+            self.search_index = self._ensure_search_index(conn)
+
+    def _ensure_search_index(self, conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='employees_fts'").fetchone()
+        try:
+            for statement in SEARCH_INDEX_SCHEMA:
+                conn.execute(statement)
+        except sqlite3.OperationalError:
+            # FTS5 or the trigram tokenizer isn't available in this SQLite build
+            return False
+        if not exists:
+            self.rebuild_search_index(conn)
+        return True
+
+    def rebuild_search_index(self, conn=None):
+        if conn is None:
+            with self.transaction() as conn:
+                return self.rebuild_search_index(conn)
+        conn.execute("INSERT INTO employees_fts(employees_fts) VALUES ('rebuild')")
+
+    def rebuild_analytics(self, conn=None):
+        # Recount the summary table from scratch, e.g. after writes that bypassed the triggers
+        if conn is None:
+            with self.transaction() as conn:
+                return self.rebuild_analytics(conn)
+        conn.execute("DELETE FROM employee_stats")
+        conn.execute(ANALYTICS_DELTA.format(sign="", where="true"))
+
+    @contextmanager
+    def transaction(self):
+        # Runs on the caller's thread with the write connection borrowed from the writer
+        with self.writes.exclusive() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self.instruments.increment("commits")
+
+    def close(self):
+        self.writes.close()
+        self.pool.close()
+        self._version_conn.close()
+        self.cache.clear()
+
+    @instrumented()
+    def get_column_names(self):
+        with self.pool.connection() as conn:
+            return self._columns(conn)
+
+    def _columns(self, conn):
+        # Schema cache: PRAGMA schema_version moves with every schema change, from any connection,
+        # so table_info is only read again after one. Uncommitted schemas are never cached.
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if self._schema is not None and self._schema[0] == version:
+            return list(self._schema[1])
+        columns = [info[1] for info in conn.execute("PRAGMA table_info(employees)")]
+        if not conn.in_transaction:
+            self._schema = (version, columns)
+        return list(columns)
+
+    def add_columns(self, columns):
+        # Extra columns brought in by imports; existing ones are left alone, without a transaction
+        # when there is nothing to add
+        if not new_columns(self.get_column_names(), columns):
+            return []
+        with self.transaction() as conn:
+            return self._add_columns(conn, columns)
+
+    def _add_columns(self, conn, columns):
+        new = new_columns(self._columns(conn), columns)
+        for column in new:
+            conn.execute(f'ALTER TABLE employees ADD COLUMN "{column}" TEXT')
+        if new:
+            conn.execute(BUMP_GENERATION)
+        return new
+
+    @instrumented(rows=int)
+    def clear_employees(self):
+        with self.transaction() as conn:
+            return conn.execute("DELETE FROM employees").rowcount
+
+    @instrumented(rows=int)
+    def insert_employee(self, details):
+        return self.submit("insert", details).result()
+
+    def _existing_ids(self, conn, ids, chunk_size=500):
+        existing = set()
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            existing.update(row[0] for row in conn.execute(f"SELECT id FROM employees WHERE id IN ({placeholders})", chunk))
+        return existing
+
+    @instrumented(rows=lambda report: len(report["inserted"]) + len(report["replaced"]), capture=False)
+    def insert_many(self, rows, on_conflict="skip", columns=EMPLOYEE_COLUMNS):
+        # columns lets imports carry extra columns (see add_columns); id must come first
+        if on_conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"Unknown conflict policy '{on_conflict}'. Expected one of: {', '.join(CONFLICT_POLICIES)}")
+        # Ids are stored as text, so compare them as text too
+        rows = [(row[0] if isinstance(row[0], str) or row[0] is None else str(row[0]),) + tuple(row[1:]) for row in rows]
+        report = {"inserted": [], "replaced": [], "skipped": [], "conflicted": []}
+        if not rows:
+            return report
+
+        # Hold the write lock while classifying rows so the report matches what gets written
+        with self.transaction() as conn:
+            seen = self._existing_ids(conn, [row[0] for row in rows])
+            to_write = []
+            for row in rows:
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    report["inserted"].append(row[0])
+                    to_write.append(row)
+                elif on_conflict == "replace":
+                    report["replaced"].append(row[0])
+                    to_write.append(row)
+                elif on_conflict == "skip":
+                    report["skipped"].append(row[0])
+                else:
+                    report["conflicted"].append(row[0])
+
+            if report["conflicted"]:
+                # "fail" writes all or nothing
+                report["inserted"] = []
+                return report
+
+            column_list = ", ".join(f'"{column}"' for column in columns)
+            sql = f"INSERT INTO employees ({column_list}) VALUES ({', '.join('?' * len(columns))})"
+            if on_conflict == "replace":
+                updates = ", ".join(f'"{column}"=excluded."{column}"' for column in columns[1:])
+                sql += f" ON CONFLICT(id) DO UPDATE SET {updates}"
+            with self._bulk_load(conn, len(to_write), report["replaced"]):
+                conn.executemany(sql, to_write)
+        return report
+
+    @contextmanager
+    def _bulk_load(self, conn, row_count, replaced_ids=()):
+        # Swap the per-row search index and analytics triggers for set-based statements on large
+        # batches. Runs inside the caller's write transaction, so other connections never see the
+        # triggers missing.
+        if row_count < BULK_INDEX_THRESHOLD:
+            yield
+            return
+        last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM employees").fetchone()[0]
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM bulk_ids")
+        conn.executemany("INSERT OR IGNORE INTO bulk_ids (id) VALUES (?)", ((employee_id,) for employee_id in replaced_ids))
+        # Take the rows about to be replaced out first, then add them back with their new values
+        replaced = "id IN (SELECT id FROM bulk_ids)"
+        if self.search_index:
+            conn.execute(f'''INSERT INTO employees_fts(employees_fts, rowid, id, name, role)
+                             SELECT 'delete', rowid, id, name, role FROM employees WHERE {replaced}''')
+            conn.execute("DROP TRIGGER employees_fts_insert")
+            conn.execute("DROP TRIGGER employees_fts_update")
+        conn.execute(ANALYTICS_DELTA.format(sign="-", where=replaced))
+        conn.execute("DROP TRIGGER employee_stats_insert")
+        conn.execute("DROP TRIGGER employee_stats_update")
+        conn.execute("DROP TRIGGER employees_generation_insert")
+        conn.execute("DROP TRIGGER employees_generation_update")
+        conn.execute("DROP TRIGGER employee_changes_insert")
+        conn.execute("DROP TRIGGER employee_changes_update")
+        yield
+        written = f"rowid > ? OR {replaced}"
+        if self.search_index:
+            conn.execute(f'''INSERT INTO employees_fts(rowid, id, name, role)
+                             SELECT rowid, id, name, role FROM employees WHERE {written}''', (last_rowid,))
+            conn.execute(SEARCH_INDEX_SCHEMA[1])
+            conn.execute(SEARCH_INDEX_SCHEMA[3])
+        conn.execute(ANALYTICS_DELTA.format(sign="", where=written), (last_rowid,))
+        conn.execute("DELETE FROM employee_stats WHERE headcount <= 0")
+        conn.execute(ANALYTICS_SCHEMA[1])
+        conn.execute(ANALYTICS_SCHEMA[3])
+        conn.execute(BUMP_GENERATION)
+        conn.execute(GENERATION_SCHEMA[2])
+        conn.execute(GENERATION_SCHEMA[3])
+        conn.execute(f'''INSERT INTO employee_changes (id, op)
+                         SELECT id, CASE WHEN {replaced} THEN 'update' ELSE 'insert' END FROM employees
+                         WHERE {written} ORDER BY rowid''', (last_rowid,))
+        conn.execute(CHANGE_LOG_SCHEMA[1])
+        conn.execute(CHANGE_LOG_SCHEMA[2])
+
+    def upsert_many(self, rows):
+        return self.insert_many(rows, on_conflict="replace")
+
+    @instrumented(rows=int)
+    def update_employee(self, id, details):
+        return self.submit("update", id, details).result()
+
+    @instrumented(rows=int)
+    def delete_employee(self, employee_id):
+        return self.submit("delete", employee_id).result()
+
+    @instrumented(rows=int)
+    def update_where(self, filters, changes, dry_run=False):
+        # Set-based update of every employee matching filters, in one statement. changes maps
+        # name/age/role to new values; rows that already have them are left alone, so only real
+        # changes reach the change log. Returns the number of rows changed (or that would be).
+        unknown = [column for column in changes if column not in BULK_UPDATE_COLUMNS]
+        if not changes or unknown:
+            raise ValueError(f"Can only bulk update {', '.join(BULK_UPDATE_COLUMNS)}; got {', '.join(unknown) or 'nothing'}")
+        conditions, params = filter_conditions(filters)
+        conditions.append("(" + " OR ".join(f"{column} IS NOT ?" for column in changes) + ")")
+        params += changes.values()
+        where = " AND ".join(conditions)
+        if dry_run:
+            with self.pool.connection() as conn:
+                return conn.execute(f"SELECT COUNT(*) FROM employees WHERE {where}", params).fetchone()[0]
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        with self.transaction() as conn:
+            return conn.execute(f"UPDATE employees SET {assignments} WHERE {where}", [*changes.values(), *params]).rowcount
+
+    @instrumented(rows=int)
+    def delete_where(self, filters, dry_run=False):
+        # Set-based delete of every employee matching filters; an empty filter matches everyone
+        conditions, params = filter_conditions(filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if dry_run:
+            return self.count_employees(filters)
+        with self.transaction() as conn:
+            return conn.execute(f"DELETE FROM employees {where}", params).rowcount
+
+    @instrumented(rows=int, capture=False)
+    def delete_many(self, ids, dry_run=False):
+        # Delete a list of ids (e.g. an uploaded file) in one transaction; unknown ids are ignored
+        ids = [employee_id if isinstance(employee_id, str) else str(employee_id) for employee_id in ids]
+        if dry_run:
+            with self.pool.connection() as conn:
+                return len(self._existing_ids(conn, list(set(ids))))
+        with self.transaction() as conn:
+            return self._delete_ids(conn, ids)
+
+    def _delete_ids(self, conn, ids):
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM bulk_ids")
+        conn.executemany("INSERT OR IGNORE INTO bulk_ids (id) VALUES (?)", ((employee_id,) for employee_id in ids))
+        return conn.execute("DELETE FROM employees WHERE id IN (SELECT id FROM bulk_ids)").rowcount
+
+    @contextmanager
+    def sync(self):
+        # Make the table match an import. Rows go in through the yielded session's apply(); only
+        # new and changed ones are written. When the block ends without an error, employees the
+        # import didn't mention are removed, unless the session was told to keep_missing(). It is
+        # all one transaction, so a sync that fails or is cancelled changes nothing.
+        with self.transaction() as conn:
+            session = SyncSession(self, conn)
+            yield session
+            session.finish()
+
+    @instrumented(rows=len)
+    @cached_query
+    def get_employees(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT * FROM employees").fetchall()
+
+    @instrumented()
+    @cached_query
+    def change_watermark(self):
+        # Sequence number of the latest change; a delta export up to here picks up from it next time
+        with self.pool.connection() as conn:
+            return conn.execute(CHANGE_WATERMARK).fetchone()[0]
+
+    def iter_changes(self, since=0, upto=None, batch_size=5000):
+        # Stream batches of (seq, op, *row): the latest change to each employee with since < seq <= upto.
+        # Rows are read as they are now, so one changed again after upto carries its newer values and
+        # comes again in the next delta; applying deltas is idempotent. Deleted employees come back as
+        # tombstones, op 'delete' with only the id set.
+        # A trimmed watermark raises ValueError here, before the caller has written anything.
+        with self.pool.connection() as conn:
+            self._check_watermark(conn, since)
+        return self._iter_changes(since, upto, batch_size)
+
+    def _check_watermark(self, conn, since):
+        trimmed_to = conn.execute("SELECT value FROM storage_meta WHERE key = 'changes_trimmed_to'").fetchone()[0]
+        if since < trimmed_to:
+            raise ValueError(f"Changes up to {trimmed_to} were trimmed; start from {trimmed_to} or export everything")
+
+    def _iter_changes(self, since, upto, batch_size):
+        with self.pool.connection() as conn:
+            # Checked again on this connection, in case a trim landed in between
+            self._check_watermark(conn, since)
+            if upto is None:
+                upto = conn.execute(CHANGE_WATERMARK).fetchone()[0]
+            cursor = conn.execute('''
+                SELECT latest.seq,
+                       CASE WHEN employees.id IS NULL THEN 'delete'
+                            WHEN entry.op = 'delete' THEN 'insert' ELSE entry.op END,
+                       latest.id, employees.*
+                FROM (SELECT id, MAX(seq) AS seq FROM employee_changes
+                      WHERE seq > ? AND seq <= ? GROUP BY id) AS latest
+                JOIN employee_changes AS entry ON entry.seq = latest.seq
+                LEFT JOIN employees ON employees.id = latest.id
+                ORDER BY latest.seq''', (since, upto))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                # The row's own id comes after the log's; keep the log's, which tombstones still have
+                yield [(seq, op, employee_id, *row[1:]) for seq, op, employee_id, *row in rows]
+
+    def trim_changes(self, upto):
+        # Drop log entries up to a watermark every consumer has synced past. A watermark past the
+        # latest change is clamped to it, so exports from the current watermark keep working.
+        # Returns the number of entries removed.
+        with self.transaction() as conn:
+            upto = min(upto, conn.execute(CHANGE_WATERMARK).fetchone()[0])
+            removed = conn.execute("DELETE FROM employee_changes WHERE seq <= ?", (upto,)).rowcount
+            conn.execute("UPDATE storage_meta SET value = MAX(value, ?) WHERE key = 'changes_trimmed_to'", (upto,))
+        return removed
+
+    def iter_employees(self, batch_size=5000):
+        # Stream the table in fetchmany batches instead of materializing it
+        with self.pool.connection() as conn:
+            cursor = conn.execute("SELECT * FROM employees ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    @instrumented()
+    @cached_query
+    def get_text_widths(self):
+        # Widest value per column, for fixed-width text exports. Like pandas, integer
+        # columns pad their header by one character.
+        columns = self.get_column_names()
+        stats = ", ".join(f"""SUM(typeof("{col}") != 'integer') = 0, MAX(LENGTH(COALESCE("{col}", 'None')))"""
+                          for col in columns)
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {stats} FROM employees").fetchone()
+        return [max(len(col) + (1 if numeric else 0), width or 0)
+                for col, numeric, width in zip(columns, row[::2], row[1::2])]
+
+    @instrumented()
+    @cached_query
+    def count_employees(self, filters=None):
+        conditions, params = filter_conditions(filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM employees {where}", params).fetchone()[0]
+
+    @instrumented()
+    @cached_query
+    def count_before(self, employee_id):
+        # Position of an id in the listing order
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM employees WHERE id < ?", (str(employee_id),)).fetchone()[0]
+
+    @instrumented(rows=len)
+    @cached_query
+    def get_workforce_stats(self):
+        # (role, age band, headcount) rows from the trigger-maintained summary
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT role, age_band, headcount FROM employee_stats ORDER BY role, age_band").fetchall()
+
+    @instrumented()
+    @cached_query
+    def has_untyped_ages(self):
+        # True if some age didn't convert to an integer (legacy data); the age index answers it
+        with self.pool.connection() as conn:
+            return bool(conn.execute('''SELECT EXISTS (SELECT 1 FROM employees
+                                        WHERE age IS NOT NULL AND typeof(age) != 'integer')''').fetchone()[0])
+
+    @instrumented(rows=len)
+    @cached_query
+    def get_roles(self):
+        # Walks the role index rather than the table
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT role FROM employees WHERE role IS NOT NULL ORDER BY role")]
+
+    @instrumented(rows=lambda page: len(page[0]))
+    @cached_query
+    def get_employees_page(self, page_size=50, after=None, order_by="id", descending=False, filters=None):
+        # Keyset pagination: seek past the previous page's last row instead of using OFFSET,
+        # so every page costs the same no matter how deep it is
+        if order_by not in PAGE_SORT_KEYS:
+            raise ValueError(f"Cannot page by '{order_by}'. Expected one of: {', '.join(PAGE_SORT_KEYS)}")
+        direction, op = ("DESC", "<") if descending else ("ASC", ">")
+        conditions, params = filter_conditions(filters)
+        if after and order_by == "id":
+            conditions.append(f"id {op} ?")
+            params.append(after[1])
+        elif after and after[0] is None:
+            # NULL sorts before every value: the rest of the NULL run, then (ascending) everything else
+            rest = "" if descending else f" OR {order_by} IS NOT NULL"
+            conditions.append(f"(({order_by} IS NULL AND id {op} ?){rest})")
+            params.append(after[1])
+        elif after:
+            # A row-value comparison with NULL is never true, so descending pages add the NULL run back
+            rest = f" OR {order_by} IS NULL" if descending else ""
+            conditions.append(f"(({order_by}, id) {op} (?, ?){rest})")
+            params += after
+        order = f"id {direction}" if order_by == "id" else f"{order_by} {direction}, id {direction}"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT * FROM employees {where} ORDER BY {order} LIMIT ?"
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, (*params, page_size)).fetchall()
+        if len(rows) < page_size:
+            return rows, None
+        last = rows[-1]
+        return rows, (last[PAGE_SORT_KEYS.index(order_by)], last[0])
+
+    @instrumented(rows=lambda row: int(row is not None))
+    @cached_query
+    def get_employee(self, employee_id):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT * FROM employees WHERE id=?", (employee_id,)).fetchone()
+
+    @instrumented(rows=len)
+    @cached_query
+    def search_employees(self, query, limit=-1):
+        query = query.strip()
+        with self.pool.connection() as conn:
+            if self.search_index and len(query) >= MIN_INDEXED_QUERY:
+                # A quoted trigram phrase matches the query anywhere in id, name or role.
+                # Exact ID hits come first, then prefix matches, then bm25 rank.
+                phrase = '"' + query.replace('"', '""') + '"'
+                return conn.execute('''SELECT employees.* FROM employees_fts
+                                       JOIN employees ON employees.rowid = employees_fts.rowid
+                                       WHERE employees_fts MATCH ?
+                                       ORDER BY employees.id = ? DESC,
+                                                substr(employees.name, 1, ?) = ? COLLATE NOCASE DESC,
+                                                employees_fts.rank
+                                       LIMIT ?''',
+                                    (phrase, query, len(query), query, limit)).fetchall()
+            pattern = f"%{query}%"
+            return conn.execute("SELECT * FROM employees WHERE name LIKE ? OR id LIKE ? OR role LIKE ? LIMIT ?",
+                                (pattern, pattern, pattern, limit)).fetchall()
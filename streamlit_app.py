@@ -1,6 +1,7 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
+from roster import Roster
+from storage import DatabaseManager
 
 # Set up the page metadata
 st.set_page_config(
@@ -10,33 +11,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-class DatabaseManager:
-    def __init__(self, db_name='employee.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
-        self.create_table()
+PAGE_SIZE = 50
 
-    def create_table(self):
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS employees
-                              (id INTEGER PRIMARY KEY, name TEXT, age TEXT, role TEXT)''')
-        self.conn.commit()
-
-    def insert_employee(self, details):
-        try:
-            self.cursor.execute("INSERT INTO employees (id, name, age, role) VALUES (?, ?, ?, ?)", details)
-            self.conn.commit()
-            return True
-        except sqlite3.IntegrityError as e:
-            st.error("❌ An error occurred while inserting data: " + str(e))
-            return False
-
-    def delete_employee(self, employee_id):
-        self.cursor.execute("DELETE FROM employees WHERE id=?", (employee_id,))
-        self.conn.commit()
-
-    def get_employees(self):
-        self.cursor.execute("SELECT * FROM employees")
-        return self.cursor.fetchall()
+@st.cache_resource
+def get_db_manager():
+    # Shared storage, also used by ems.py and the Tkinter app
+    return DatabaseManager()
 
 def main():
     # Add title and description
@@ -54,7 +34,7 @@ def main():
         """)
         st.write("Developed by Parthiv Koli 🧑‍💻")
 
-    db_manager = DatabaseManager()
+    db_manager = get_db_manager()
 
     # Input fields for employee details
     st.subheader("👤 Employee Details")
@@ -80,27 +60,44 @@ def main():
     with col3:
         if st.button("Save 💾"):
             if id and name and age and role:
-                if db_manager.insert_employee((id, name, age, role)):
-                    st.success("✅ Employee added successfully!")
+                try:
+                    if db_manager.insert_employee((id, name, age, role)):
+                        st.success("✅ Employee added successfully!")
+                    else:
+                        st.error("❌ An employee with this ID already exists.")
+                except sqlite3.Error as e:
+                    st.error(f"❌ Could not save the employee: {e}")
             else:
                 st.error("❌ Please fill all fields.")
 
     with col4:
         if st.button("Delete 🗑️"):
             if id:
-                db_manager.delete_employee(id)
-                st.success("✅ Employee deleted successfully!")
+                try:
+                    db_manager.delete_employee(id)
+                    st.success("✅ Employee deleted successfully!")
+                except sqlite3.Error as e:
+                    st.error(f"❌ Could not delete the employee: {e}")
             else:
                 st.error("❌ Please enter an ID to delete.")
 
-    # Display employees
+    # Display employees one page at a time
     st.subheader("📋 Employee List")
-    employees = db_manager.get_employees()
+    cursors = st.session_state.setdefault("page_cursors", [None])
+    employees, next_cursor = db_manager.get_employees_page(PAGE_SIZE, after=cursors[-1])
     if employees:
-        df = pd.DataFrame(employees, columns=["ID", "Name", "Age", "Role"])
+        df = Roster((row[:4] for row in employees), ["ID", "Name", "Age", "Role"]).to_frame()
         st.dataframe(df)
+        total = db_manager.count_employees()
+        st.caption(f"Page {len(cursors)} of {max(1, -(-total // PAGE_SIZE))} · {total} employees")
     else:
         st.warning("⚠️ No employees found.")
 
+    col5, col6 = st.columns(2)
+    with col5:
+        st.button("⬅️ Previous", on_click=cursors.pop, disabled=len(cursors) == 1)
+    with col6:
+        st.button("Next ➡️", on_click=cursors.append, args=(next_cursor,), disabled=next_cursor is None)
+
 if __name__ == "__main__":
     main()
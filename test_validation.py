@@ -0,0 +1,92 @@
+import random
+import unittest
+import numpy as np
+import pandas as pd
+from validation import normalize_column_name, validate_imported_data, validate_inputs
+
+def validate_per_row(df):
+    # The iterrows validator validate_imported_data replaced, kept as the reference it must match
+    expected_columns = ["id", "name", "age", "role"]
+    df.columns = [normalize_column_name(col) for col in df.columns]
+    missing_cols = [col for col in expected_columns if col not in df.columns]
+    if missing_cols:
+        return False, [f"Missing required columns: {', '.join(missing_cols)}"], df
+    df = df[expected_columns]
+    df = df.fillna('')
+    df['id'] = df['id'].astype(str).str.strip()
+    df['name'] = df['name'].astype(str).str.strip()
+    df['role'] = df['role'].astype(str).str.strip()
+    errors = []
+    valid_rows = []
+    statuses = []
+    for index, row in df.iterrows():
+        row_errors = validate_inputs(row['id'], row['name'], row['age'], row['role'])
+        if row_errors:
+            errors.append(f"Row {index + 1}: {', '.join(row_errors)}")
+            statuses.append(f"Failed: {', '.join(row_errors)}")
+        else:
+            valid_rows.append((row['id'], row['name'], int(row['age']), row['role']))
+            statuses.append("Success")
+    df['Status'] = statuses
+    return valid_rows, errors, df
+
+IDS = ["E1", "e-2", "", "   ", "bad id", "id!", "  E3  ", "E_4", None, np.nan, "É5", "12"]
+NAMES = ["Ann", "A", " B ", "", "   ", None, np.nan, "Jo", "  Zoë  ", "\t\t"]
+AGES = [30, 17, 18, 100, 101, 18.9, 17.5, "42", " 42 ", "4_2", "18.5", "abc", "", None, np.nan,
+        "+30", "-5", "١٢", True, "1e2"]
+ROLES = ["Engineer", "", "  ", None, np.nan, " Designer "]
+
+class ValidateImportedDataTest(unittest.TestCase):
+    def assertSameResult(self, df):
+        expected_rows, expected_errors, expected_df = validate_per_row(df.copy())
+        rows, errors, checked = validate_imported_data(df.copy())
+        self.assertEqual(rows, expected_rows)
+        self.assertEqual(errors, expected_errors)
+        if expected_rows is not False:
+            self.assertEqual(checked["Status"].tolist(), expected_df["Status"].tolist())
+            self.assertEqual([type(age) for _, _, age, _ in rows], [int] * len(rows))
+
+    def test_edge_cases(self):
+        # Every id, name and role against every age, so each check meets each kind of value
+        records = [(IDS[i % len(IDS)], NAMES[i % len(NAMES)], age, ROLES[i % len(ROLES)])
+                   for i, age in enumerate(AGES * len(IDS))]
+        self.assertSameResult(pd.DataFrame(records, columns=["id", "name", "age", "role"], dtype=object))
+
+    def test_blank_ids(self):
+        self.assertSameResult(pd.DataFrame({"id": ["", " ", None, "E1"], "name": ["Ann"] * 4,
+                                            "age": [30] * 4, "role": ["Engineer"] * 4}))
+
+    def test_whitespace_names(self):
+        self.assertSameResult(pd.DataFrame({"id": ["E1", "E2", "E3", "E4"], "name": ["   ", " A ", "\t", " Bo "],
+                                            "age": [30] * 4, "role": ["Engineer"] * 4}))
+
+    def test_numeric_columns(self):
+        # Columns pandas parsed as numbers: float ages with gaps, integer ids
+        self.assertSameResult(pd.DataFrame({"Employee ID": [1, 2, 3, 4], "Full Name": ["Ann", "Bob", "Cy", "Di"],
+                                            "Years": [30.0, 17.9, np.nan, 100.5], "Job Title": ["A", "B", "C", "D"]}))
+        self.assertSameResult(pd.DataFrame({"id": ["E1", "E2"], "name": ["Ann", "Bob"],
+                                            "age": np.array([18, 101], dtype="int64"), "role": ["A", "B"]}))
+
+    def test_non_numeric_ages(self):
+        self.assertSameResult(pd.DataFrame({"id": ["E1", "E2", "E3", "E4", "E5"], "name": ["Ann"] * 5,
+                                            "age": ["thirty", "30.0", "3O", "", "25"], "role": ["Engineer"] * 5}))
+
+    def test_missing_columns(self):
+        self.assertSameResult(pd.DataFrame({"id": ["E1"], "name": ["Ann"], "position": ["Engineer"]}))
+
+    def test_empty_frame(self):
+        self.assertSameResult(pd.DataFrame({"id": [], "name": [], "age": [], "role": []}, dtype=object))
+
+    def test_random_frames(self):
+        generator = random.Random(2)
+        for _ in range(20):
+            size = generator.randint(1, 300)
+            self.assertSameResult(pd.DataFrame({
+                "id": [generator.choice(IDS) for _ in range(size)],
+                "name": [generator.choice(NAMES) for _ in range(size)],
+                "age": [generator.choice(AGES) for _ in range(size)],
+                "role": [generator.choice(ROLES) for _ in range(size)],
+            }, index=generator.sample(range(size * 2), size)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import re
+import numpy as np
+import pandas as pd
+from instrumentation import measured
+
+def normalize_column_name(col):
+    col = col.lower().strip()
+    mapping = {
+        'id': ['id', 'employee id', 'emp id', 'identifier'],
+        'name': ['name', 'employee name', 'full name', 'person'],
+        'age': ['age', 'years', 'employee age'],
+        'role': ['role', 'position', 'job title', 'title', 'occupation']
+    }
+    for standard, variations in mapping.items():
+        if col in variations or col.replace(' ', '') in [v.replace(' ', '') for v in variations]:
+            return standard
+    return col
+
+REQUIRED_COLUMNS = ["id", "name", "age", "role"]
+
+def standardize_columns(columns):
+    # Required columns get their standard names; any other column keeps its own
+    return [normalize_column_name(str(col)) if normalize_column_name(str(col)) in REQUIRED_COLUMNS else col
+            for col in columns]
+
+# Shared by the single-record and column-wise validators so their messages stay identical
+ID_PATTERN = r'[a-zA-Z0-9-]+'
+ID_ERROR = "ID must be non-empty and alphanumeric (hyphens allowed)."
+NAME_ERROR = "Name must be at least 2 characters long."
+AGE_RANGE_ERROR = "Age must be a number between 18 and 100."
+AGE_NUMBER_ERROR = "Age must be a valid number."
+ROLE_ERROR = "Role must be specified."
+
+def validate_inputs(id, name, age, role):
+    errors = []
+    if not id or not isinstance(id, str) or not re.match(f'^{ID_PATTERN}$', id):
+        errors.append(ID_ERROR)
+    if not name or not isinstance(name, str) or len(name.strip()) < 2:
+        errors.append(NAME_ERROR)
+    try:
+        age = int(age)
+        if not (18 <= age <= 100):
+            errors.append(AGE_RANGE_ERROR)
+    except (ValueError, TypeError):
+        errors.append(AGE_NUMBER_ERROR)
+    if not role or not isinstance(role, str):
+        errors.append(ROLE_ERROR)
+    return errors
+
+def parse_ages(ages):
+    # Column-wise int(age): numbers are truncated, text must be an integer literal
+    if pd.api.types.is_numeric_dtype(ages):
+        return ages.to_numpy(dtype='float64')
+    values = ages.to_numpy(dtype=object)
+    is_text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+    numbers = pd.to_numeric(pd.Series(np.where(is_text, np.nan, values)), errors='coerce').to_numpy(dtype='float64')
+    text = pd.Series(values[is_text], dtype=object)
+    literal = text.str.fullmatch(r'\s*[+-]?\d+(?:_\d+)*\s*').to_numpy(dtype=bool)
+    parsed = pd.to_numeric(text.where(literal).str.replace('_', '', regex=False), errors='coerce').to_numpy(dtype='float64')
+    # Non-ASCII digits are valid for int() but not for to_numeric
+    leftover = literal & np.isnan(parsed)
+    if leftover.any():
+        parsed[leftover] = [int(value) for value in text[leftover]]
+    numbers[is_text] = parsed
+    return numbers
+
+def validate_columns(df):
+    # Vectorized validate_inputs over cleaned id/name/age/role columns.
+    # Returns arrays of the joined error message per row ('' when valid) and the parsed ages.
+    ages = parse_ages(df['age'])
+    valid_number = np.isfinite(ages)
+    ages = np.trunc(np.where(valid_number, ages, 0))
+    checks = [
+        (~df['id'].str.fullmatch(ID_PATTERN).to_numpy(dtype=bool), ID_ERROR),
+        (df['name'].str.len().to_numpy() < 2, NAME_ERROR),
+        (valid_number & ((ages < 18) | (ages > 100)), AGE_RANGE_ERROR),
+        (~valid_number, AGE_NUMBER_ERROR),
+        (df['role'].to_numpy() == '', ROLE_ERROR),
+    ]
+    messages = np.full(len(df), '', dtype=object)
+    for mask, message in checks:
+        messages = np.where(mask, messages + (message + ", "), messages)
+    return pd.Series(messages, dtype=object).str[:-2].to_numpy(dtype=object), ages
+
+@measured(rows=lambda result: len(result[2]))
+def validate_imported_data(df):
+    expected_columns = ["id", "name", "age", "role"]
+    # Normalize column names
+    df.columns = [normalize_column_name(col) for col in df.columns]
+    
+    # Check for required columns
+    missing_cols = [col for col in expected_columns if col not in df.columns]
+    if missing_cols:
+        return False, [f"Missing required columns: {', '.join(missing_cols)}"], df
+    
+    # Keep only the required columns
+    df = df[expected_columns]
+    
+    # Clean data
+    df = df.fillna('')  # Replace NaN with empty string
+    df['id'] = df['id'].astype(str).str.strip()
+    df['name'] = df['name'].astype(str).str.strip()
+    df['role'] = df['role'].astype(str).str.strip()
+    
+    messages, ages = validate_columns(df)
+    failed = messages != ''
+    errors = [f"Row {index + 1}: {message}" for index, message in zip(df.index[failed], messages[failed])]
+    valid_rows = list(zip(df['id'].to_numpy()[~failed].tolist(), df['name'].to_numpy()[~failed].tolist(),
+                          ages[~failed].astype('int64').tolist(), df['role'].to_numpy()[~failed].tolist()))
+
+    df['Status'] = np.where(failed, "Failed: " + messages, "Success")
+    return valid_rows, errors, df
+
+def validate_frame(frame):
+    # validate_imported_data for imports that keep every column. Returns the frame's valid rows with
+    # id, name, age and role replaced by their cleaned values, the valid (id, name, age, role) tuples
+    # and the errors; the tuples are False, and the frame empty, when required columns are missing.
+    frame = frame.set_axis(standardize_columns(frame.columns), axis=1)
+    rows, errors, checked = validate_imported_data(frame.copy())
+    if rows is False:
+        return frame.iloc[:0], False, errors
+    valid = frame[checked["Status"].to_numpy() == "Success"].copy()
+    valid[REQUIRED_COLUMNS] = pd.DataFrame(rows, index=valid.index, columns=REQUIRED_COLUMNS).to_numpy(dtype=object)
+    return valid, rows, errors
@@ -0,0 +1,182 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import pandas as pd
+from openpyxl import load_workbook
+from validation import standardize_columns, validate_frame
+
+# A parsed chunk of one sheet: frame holds its rows (only the valid ones, cleaned, when validated),
+# rows the valid (id, name, age, role) tuples and errors the validation messages tagged with the sheet name
+SheetResult = namedtuple("SheetResult", ["sheet", "frame", "rows", "errors", "row_count"])
+
+# Spawned, not forked: the Streamlit server and the Tk app both run threads
+POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+# Rows per chunk, and chunks parsed ahead of the reader; together they bound an import's memory
+CHUNK_ROWS = 50_000
+MAX_PENDING_CHUNKS = 4
+
+@contextmanager
+def open_workbook(file):
+    # Read-only mode streams rows from the sheet XML instead of building the whole workbook
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield workbook
+    finally:
+        workbook.close()
+
+def iter_rows(sheet, chunksize):
+    # Yields (DataFrame chunk, rows read so far)
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    # Required columns get their standard names so sheets with different spellings line up
+    columns = standardize_columns(str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header))
+    width = len(columns)
+    read = kept = 0
+    while True:
+        batch = list(itertools.islice(rows, chunksize))
+        if not batch:
+            break
+        read += len(batch)
+        # Pad short rows and drop rows with no values at all
+        batch = [tuple(row[:width]) + (None,) * (width - len(row))
+                 for row in batch if any(value is not None for value in row)]
+        yield pd.DataFrame(batch, columns=columns, index=range(kept, kept + len(batch))), read
+        kept += len(batch)
+
+def sheet_sizes(workbook):
+    # Data rows per sheet as recorded in each sheet's dimension, for progress
+    return {sheet.title: max((sheet.max_row or 0) - 1, 0) for sheet in workbook.worksheets}
+
+def iter_sheet_chunks(path, sheet_name, validate=True, chunksize=CHUNK_ROWS):
+    # Yields (SheetResult, rows read so far) for each chunk of one sheet, validating chunks on their
+    # own unless told otherwise. A sheet missing required columns stops after its first chunk.
+    with open_workbook(path) as workbook:
+        for frame, read in iter_rows(workbook[sheet_name], chunksize):
+            if not validate:
+                yield SheetResult(sheet_name, frame, [], [], len(frame)), read
+                continue
+            valid, rows, errors = validate_frame(frame)
+            errors = [f"{sheet_name}: {error}" for error in errors]
+            yield SheetResult(sheet_name, valid, rows or [], errors, len(frame)), read
+            if rows is False:
+                return
+
+# Set in each pool process: the queue chunks go back to the parent on, and the parent's stop flag
+_chunks = None
+_stop = None
+
+def _init_worker(chunks, stop):
+    global _chunks, _stop
+    _chunks, _stop = chunks, stop
+    # Once the parent stops reading, chunks still buffered for it are dropped rather than waited on
+    _chunks.cancel_join_thread()
+
+def _put(message):
+    while not _stop.is_set():
+        try:
+            _chunks.put(message, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _send_sheet(path, sheet_name, validate, chunksize):
+    # Runs in a pool process: stream one sheet's chunks to the parent, then say it is done
+    try:
+        for result, read in iter_sheet_chunks(path, sheet_name, validate, chunksize):
+            if not _put(("chunk", result, read)):
+                return
+    except Exception as e:
+        _put(("failed", sheet_name, e))
+    else:
+        _put(("done", sheet_name, None))
+
+@contextmanager
+def workbook_path(file):
+    # Pool processes open the workbook themselves, so uploads are spilled to a temporary file once
+    if isinstance(file, (str, os.PathLike)):
+        yield file
+        return
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            file.seek(0)
+            shutil.copyfileobj(file, f)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def iter_sheets(file, validate=True, max_workers=None, chunksize=CHUNK_ROWS):
+    # Yields (SheetResult, fraction done) a chunk at a time, parsing sheets in parallel when there are
+    # several. Chunks of one sheet come in order; chunks of different sheets interleave.
+    with workbook_path(file) as path:
+        with open_workbook(path) as workbook:
+            sizes = sheet_sizes(workbook)
+        if not any(sizes.values()):
+            # Writers that leave out the dimension (openpyxl's write-only mode): count sheets instead
+            sizes = dict.fromkeys(sizes, 1)
+        total = sum(sizes.values())
+        read = dict.fromkeys(sizes, 0)
+
+        def progress(sheet, rows, finished=False):
+            read[sheet] = sizes[sheet] if finished else min(rows, sizes[sheet])
+            return sum(read.values()) / total if total else 1.0
+
+        workers = min(len(sizes), max_workers or os.cpu_count() or 1)
+        if workers < 2:
+            for name in sizes:
+                for result, rows in iter_sheet_chunks(path, name, validate, chunksize):
+                    yield result, progress(name, rows)
+                progress(name, 0, finished=True)
+            return
+        # Workers hand chunks over through a bounded queue, so memory stays at a few chunks per
+        # worker however large the sheets are
+        chunks = POOL_CONTEXT.Queue(maxsize=MAX_PENDING_CHUNKS)
+        stop = POOL_CONTEXT.Event()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT,
+                                   initializer=_init_worker, initargs=(chunks, stop))
+        try:
+            futures = [pool.submit(_send_sheet, path, name, validate, chunksize) for name in sizes]
+            remaining = len(sizes)
+            while remaining:
+                try:
+                    kind, payload, detail = chunks.get(timeout=1)
+                except queue.Empty:
+                    # A worker that died (killed, out of memory) never reports back
+                    for future in futures:
+                        if future.done() and future.exception():
+                            raise future.exception()
+                    continue
+                if kind == "chunk":
+                    yield payload, progress(payload.sheet, detail)
+                elif kind == "failed":
+                    raise detail
+                else:
+                    remaining -= 1
+                    progress(payload, 0, finished=True)
+        finally:
+            stop.set()
+            pool.shutdown(cancel_futures=True)
+
+def read_workbook(file, max_workers=None):
+    # Every sheet as one DataFrame, in workbook order
+    with workbook_path(file) as path:
+        with open_workbook(path) as workbook:
+            names = workbook.sheetnames
+        frames = {name: [] for name in names}
+        for result, _ in iter_sheets(path, validate=False, max_workers=max_workers):
+            frames[result.sheet].append(result.frame)
+    frames = [frame for name in names for frame in frames[name] if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()